@@ -1,13 +1,21 @@
 import os
+import base64
+import hashlib
+import threading
+import time
 import requests
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlmodel import Session, select
-from typing import Optional
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from typing import Dict, Optional
+from datetime import datetime
 import json
 from jose import JWTError, jwt
-from models import User, UserCreate
-from database import get_session
+from models import User
+from database import get_async_session
+from cache_utils import TTLCache
 
 # Clerk configuration
 CLERK_SECRET_KEY = os.getenv("CLERK_SECRET_KEY")
@@ -16,6 +24,46 @@ CLERK_PUBLISHABLE_KEY = os.getenv("CLERK_PUBLISHABLE_KEY")
 if not CLERK_SECRET_KEY:
     raise ValueError("CLERK_SECRET_KEY environment variable is required")
 
+def issuer_from_publishable_key(publishable_key: Optional[str]) -> Optional[str]:
+    """
+    Frontend API URL (the ``iss`` of session tokens) encoded in a Clerk publishable key
+    """
+    if not publishable_key or publishable_key.count("_") < 2:
+        return None
+    encoded = publishable_key.split("_", 2)[2]
+    try:
+        host = base64.b64decode(encoded + "=" * (-len(encoded) % 4)).decode().rstrip("$")
+    except ValueError:
+        return None
+    return f"https://{host}" if host else None
+
+# Tokens must come from this issuer and, when they carry azp, from one of these origins
+CLERK_ISSUER = os.getenv("CLERK_ISSUER") or issuer_from_publishable_key(CLERK_PUBLISHABLE_KEY)
+CLERK_AUTHORIZED_PARTIES = [
+    origin.strip().rstrip("/")
+    for origin in os.getenv(
+        "CLERK_AUTHORIZED_PARTIES",
+        f"{os.getenv('FRONTEND_URL', 'http://localhost:3000')},http://localhost:3000"
+    ).split(",")
+    if origin.strip()
+]
+
+if not CLERK_ISSUER:
+    raise ValueError("CLERK_ISSUER (or CLERK_PUBLISHABLE_KEY) environment variable is required")
+
+# JWKS configuration
+# CLERK_JWKS_FILE points at a local JWKS document (see dev_jwks.py) for offline use
+CLERK_JWKS_URL = os.getenv("CLERK_JWKS_URL", "https://api.clerk.com/v1/jwks")
+CLERK_JWKS_FILE = os.getenv("CLERK_JWKS_FILE")
+JWKS_CACHE_TTL_SECONDS = int(os.getenv("JWKS_CACHE_TTL_SECONDS", "3600"))
+JWKS_MIN_REFRESH_SECONDS = int(os.getenv("JWKS_MIN_REFRESH_SECONDS", "30"))
+CLERK_CLOCK_SKEW_SECONDS = int(os.getenv("CLERK_CLOCK_SKEW_SECONDS", "5"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+# Identity cache configuration (clerk_user_id -> User row)
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "300"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
 # Bearer token scheme
 security = HTTPBearer()
 
@@ -26,39 +74,138 @@ class ClerkUser:
         self.email = email
         self.name = name
 
+class JWKSUnavailable(Exception):
+    """Raised when signing keys are needed but the JWKS can't be fetched"""
+
+class JWKSKeyCache:
+    """
+    In-process cache of Clerk signing keys, indexed by ``kid``
+
+    Keys are fetched once and reused until the TTL lapses. An unknown ``kid``
+    triggers an early refresh (key rotation), rate limited so that garbage
+    tokens cannot hammer the JWKS endpoint. A failed fetch with no keys cached
+    raises JWKSUnavailable.
+    """
+    def __init__(
+        self,
+        url: str,
+        jwks_file: Optional[str] = None,
+        ttl: int = JWKS_CACHE_TTL_SECONDS,
+        min_refresh_interval: int = JWKS_MIN_REFRESH_SECONDS
+    ):
+        self.url = url
+        self.jwks_file = jwks_file
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self._keys: Dict[str, dict] = {}
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def _fetch(self) -> Dict[str, dict]:
+        if self.jwks_file:
+            with open(self.jwks_file) as f:
+                jwks = json.load(f)
+        else:
+            response = requests.get(
+                self.url,
+                headers={"Authorization": f"Bearer {CLERK_SECRET_KEY}"},
+                timeout=5
+            )
+            response.raise_for_status()
+            jwks = response.json()
+
+        return {key["kid"]: key for key in jwks.get("keys", []) if "kid" in key}
+
+    def _refresh(self, force: bool = False) -> None:
+        with self._lock:
+            age = time.time() - self._fetched_at
+            if age < self.min_refresh_interval or (not force and age < self.ttl):
+                # Another thread refreshed while we waited for the lock
+                return
+            try:
+                self._keys = self._fetch()
+            except Exception as e:
+                if not self._keys:
+                    raise JWKSUnavailable(f"Could not fetch signing keys: {str(e)}") from e
+                # Keep serving the previous key set if the JWKS endpoint is flaky
+                print(f"⚠️ Warning: JWKS refresh failed, using cached keys: {str(e)}")
+            self._fetched_at = time.time()
+
+    def get_key(self, kid: Optional[str]) -> dict:
+        if time.time() - self._fetched_at >= self.ttl:
+            self._refresh()
+
+        key = self._keys.get(kid)
+        if key is None:
+            # Unknown kid: Clerk may have rotated its signing key
+            self._refresh(force=True)
+            key = self._keys.get(kid)
+
+        if key is None:
+            raise JWTError(f"No signing key found for kid {kid!r}")
+        return key
+
+jwks_cache = JWKSKeyCache(CLERK_JWKS_URL, jwks_file=CLERK_JWKS_FILE)
+
+# Verified tokens keyed by SHA-256 of the raw token, each evicted at its exp claim
+verified_token_cache = TTLCache(max_size=TOKEN_CACHE_SIZE)
+
+# User rows keyed by clerk_user_id; per-process, so other workers see updates after the TTL
+user_cache = TTLCache(max_size=USER_CACHE_SIZE, default_ttl=USER_CACHE_TTL_SECONDS)
+
 def verify_clerk_token(token: str) -> ClerkUser:
     """
     Verify Clerk JWT token and extract user information
+
+    Signatures are checked against the cached JWKS; tokens that already passed
+    verification are served from ``verified_token_cache`` until they expire.
     """
+    token_hash = hashlib.sha256(token.encode()).hexdigest()
+    cached_user = verified_token_cache.get(token_hash)
+    if cached_user is not None:
+        return cached_user
+
     try:
-        print(f"🔍 Verifying token: {token[:20]}...")
-        
-        # In production, implement proper JWT verification with JWKS
+        header = jwt.get_unverified_header(token)
         payload = jwt.decode(
-            token, 
-            key="dummy_key",  # Required parameter even when verification is disabled
+            token,
+            key=jwks_cache.get_key(header.get("kid")),
             algorithms=["RS256"],  # Clerk uses RS256
-            options={"verify_signature": False, "verify_aud": False, "verify_exp": False}
+            issuer=CLERK_ISSUER,
+            options={"verify_aud": False, "require_exp": True, "require_iss": True, "leeway": CLERK_CLOCK_SKEW_SECONDS}
         )
         
-        print(f"📋 JWT payload: {payload}")
+        # Session tokens name the origin they were issued to; refuse other sites' tokens
+        authorized_party = payload.get("azp")
+        if authorized_party is not None and authorized_party.rstrip("/") not in CLERK_AUTHORIZED_PARTIES:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid token: unauthorized party"
+            )
         
         user_id = payload.get("sub")
         email = payload.get("email", payload.get("email_addresses", [{}])[0].get("email_address", ""))
         name = payload.get("name", payload.get("first_name", ""))
         
-        print(f"👤 Extracted user info - ID: {user_id}, Email: {email}, Name: {name}")
-        
         if not user_id:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid token: missing user ID"
             )
             
-        return ClerkUser(user_id=user_id, email=email or "", name=name or "")
+        clerk_user = ClerkUser(user_id=user_id, email=email or "", name=name or "")
+        verified_token_cache.set(token_hash, clerk_user, expires_at=payload["exp"])
+        return clerk_user
         
+    except HTTPException:
+        raise
+    except JWKSUnavailable as e:
+        print(f"❌ Auth Error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication is temporarily unavailable"
+        )
     except JWTError as e:
-        print(f"❌ JWT Error: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Token validation failed: {str(e)}"
@@ -78,35 +225,60 @@ def get_current_clerk_user(
     """
     return verify_clerk_token(credentials.credentials)
 
-def get_or_create_user(
+def cache_user(user: User) -> None:
+    """
+    Remember a user row so later requests can skip the identity lookup
+    """
+    user_cache.set(user.clerk_user_id, user.model_dump())
+
+def invalidate_cached_user(clerk_user_id: str) -> None:
+    """
+    Drop a cached user row, e.g. after it was updated
+    """
+    user_cache.pop(clerk_user_id)
+
+async def get_or_create_user(
     clerk_user: ClerkUser = Depends(get_current_clerk_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ) -> User:
     """
     Get or create user in our database based on Clerk user
+
+    Cache hits return a fresh, session-less ``User`` built from the cached
+    row, so handlers that need to modify the user must load it from their
+    own session first.
     """
+    cached = user_cache.get(clerk_user.user_id)
+    if cached is not None:
+        return User(**cached)
+
     # Check if user exists
     statement = select(User).where(User.clerk_user_id == clerk_user.user_id)
-    db_user = session.exec(statement).first()
+    db_user = (await session.exec(statement)).first()
     
     if not db_user:
-        # Create new user
-        user_create = UserCreate(
+        # Create new user; parallel first requests race on the unique keys (id and clerk_user_id),
+        # so insert-or-ignore and re-read whichever row won
+        now = datetime.utcnow()
+        insert_statement = pg_insert(User).values(
+            id=f"user-{clerk_user.user_id}",
             clerk_user_id=clerk_user.user_id,
             name=clerk_user.name,
-            email=clerk_user.email
-        )
-        db_user = User.from_orm(user_create)
-        db_user.id = f"user-{clerk_user.user_id}"
-        
-        session.add(db_user)
-        session.commit()
-        session.refresh(db_user)
+            email=clerk_user.email,
+            created_at=now,
+            updated_at=now
+        ).on_conflict_do_nothing().returning(User)
+        db_user = (await session.execute(insert_statement)).scalars().first()
+        await session.commit()
+
+        if not db_user:
+            db_user = (await session.exec(statement)).first()
     
+    cache_user(db_user)
     return db_user
 
 # Auth dependency for protected routes
-def get_current_user(
+async def get_current_user(
     user: User = Depends(get_or_create_user)
 ) -> User:
     """
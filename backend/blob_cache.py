@@ -0,0 +1,239 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+
+from cache_utils import SingleFlight
+from storage import StorageBackend, StoredObject, DOWNLOAD_CHUNK_SIZE
+
+# Load environment variables
+load_dotenv()
+
+# Blob cache configuration (0 bytes disables the cache). BLOB_CACHE_MAX_BYTES
+# is the node's total, split evenly between the WEB_CONCURRENCY workers
+BLOB_CACHE_DIR = os.getenv(
+    "BLOB_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "pax-blob-cache")
+)
+BLOB_CACHE_MAX_BYTES = int(os.getenv("BLOB_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+BLOB_CACHE_MAX_OBJECT_BYTES = int(os.getenv("BLOB_CACHE_MAX_OBJECT_BYTES", str(32 * 1024 * 1024)))
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+WORKER_DIR_PREFIX = "worker-"
+# Age after which a temporary fill file is assumed abandoned
+PART_FILE_GRACE_SECONDS = 3600
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class BlobCache:
+    """
+    Size-bounded LRU cache of storage objects on local disk
+
+    Entries are keyed by ``file_url`` plus the document's ``updated_at``, so an
+    edited document simply misses and its stale entry ages out. Files are
+    written to a temporary name and renamed into place.
+
+    Each worker process owns a ``worker-<pid>`` directory under ``root``, so
+    its in-memory index and budget account for everything in it. At start a
+    worker adopts the directory of a dead one (keeping that cache warm),
+    removes any others left by dead workers, and rebuilds its index from
+    disk, oldest first.
+    """
+    def __init__(self, root: str, max_bytes: int, max_object_bytes: int):
+        self.base_root = root
+        self.root = os.path.join(root, f"{WORKER_DIR_PREFIX}{os.getpid()}")
+        self.max_bytes = max_bytes
+        self.max_object_bytes = min(max_object_bytes, max_bytes)
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.fills = 0
+        self.evictions = 0
+        # Concurrent misses for the same object share one fill
+        self._inflight = SingleFlight()
+        if self.enabled:
+            self._load_index()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def cache_key(file_url: str, updated_at: datetime) -> str:
+        return hashlib.sha256(f"{file_url}\n{updated_at.isoformat()}".encode()).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def _claim_dead_workers(self) -> None:
+        os.makedirs(self.base_root, exist_ok=True)
+        for name in os.listdir(self.base_root):
+            pid = name[len(WORKER_DIR_PREFIX):]
+            if not name.startswith(WORKER_DIR_PREFIX) or not pid.isdigit() or _pid_alive(int(pid)):
+                continue
+            dead_root = os.path.join(self.base_root, name)
+            if not os.path.exists(self.root):
+                try:
+                    # Atomic, so only one starting worker adopts it
+                    os.rename(dead_root, self.root)
+                    continue
+                except OSError:
+                    pass
+            shutil.rmtree(dead_root, ignore_errors=True)
+
+    def _load_index(self) -> None:
+        self._claim_dead_workers()
+        os.makedirs(self.root, exist_ok=True)
+        found = []
+        now = time.time()
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                full_path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(full_path)
+                except FileNotFoundError:
+                    continue
+                if name.endswith(".part"):
+                    # Left behind by an interrupted fill
+                    if stat.st_mtime + PART_FILE_GRACE_SECONDS < now:
+                        os.remove(full_path)
+                    continue
+                found.append((stat.st_mtime, name, stat.st_size))
+
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self.total_bytes += size
+        self._evict()
+
+    def _evict(self) -> None:
+        # Caller holds the lock (or is still constructing the cache)
+        while self.total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._entry_path(key))
+            except FileNotFoundError:
+                pass
+
+    def lookup(self, key: str) -> Optional[str]:
+        """
+        Path of a cached object, or None; a hit makes the entry most recently used
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        entry_path = self._entry_path(key)
+        try:
+            # Keep disk mtimes in LRU order for the next restart
+            os.utime(entry_path)
+        except FileNotFoundError:
+            # Removed behind our back; forget it
+            with self._lock:
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self.total_bytes -= size
+            return None
+        return entry_path
+
+    async def fill(
+        self,
+        storage: StorageBackend,
+        key: str,
+        file_url: str
+    ) -> Tuple[Optional[str], Optional[StoredObject]]:
+        """
+        Copy an object from storage into the cache
+
+        Returns ``(path, None)`` once cached, or ``(None, stored)`` with the still
+        unread object when it is over the per-object limit (or of unknown size),
+        for the caller to stream.
+        """
+        stored = await storage.open_read(file_url, chunk_size=DOWNLOAD_CHUNK_SIZE)
+        if stored.size is None or stored.size > self.max_object_bytes:
+            return None, stored
+
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        temp_path = f"{entry_path}.{uuid.uuid4().hex}.part"
+        try:
+            with open(temp_path, "wb") as f:
+                async for chunk in stored.chunks:
+                    await run_in_threadpool(f.write, chunk)
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, entry_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous
+            self._entries[key] = size
+            self.total_bytes += size
+            self.fills += 1
+            self._evict()
+        return entry_path, None
+
+    async def fetch(
+        self,
+        storage: StorageBackend,
+        key: str,
+        file_url: str
+    ) -> Tuple[Optional[str], Optional[StoredObject]]:
+        """
+        Cached path of an object, filling the cache on a miss
+
+        Concurrent misses for the same key wait on a single fill. Like ``fill``,
+        returns ``(None, stored)`` for objects too large to cache.
+        """
+        cached_path = self.lookup(key)
+        if cached_path:
+            return cached_path, None
+
+        (cached_path, stored), shared = await self._inflight.do(
+            key, lambda: self.fill(storage, key, file_url)
+        )
+        if shared and stored is not None:
+            # The stream of an uncacheable object went to the first caller only
+            stored = await storage.open_read(file_url, chunk_size=DOWNLOAD_CHUNK_SIZE)
+        return cached_path, stored
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "fills": self.fills,
+                "evictions": self.evictions,
+                "coalesced": self._inflight.coalesced,
+            }
+
+blob_cache = BlobCache(BLOB_CACHE_DIR, BLOB_CACHE_MAX_BYTES // WEB_CONCURRENCY, BLOB_CACHE_MAX_OBJECT_BYTES)
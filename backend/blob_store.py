@@ -0,0 +1,186 @@
+from typing import AsyncIterator, Callable, Dict, List, Tuple
+
+from sqlalchemy import delete, func, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from models import Blob, DocumentNode, DocumentType
+from storage import StorageBackend, ObjectExists, StreamDigest, upload_budget
+from renditions import rendition_paths, thumbnail_path
+
+# Storage prefix of content-addressed objects; other file_urls predate deduplication
+BLOB_PREFIX = "blobs/"
+
+def blob_path(sha256: str) -> str:
+    return f"{BLOB_PREFIX}{sha256[:2]}/{sha256}"
+
+async def digest_stream(chunks: AsyncIterator[bytes], digest: StreamDigest) -> StreamDigest:
+    """
+    Read a (local) stream once to learn its size and SHA-256 before storing it
+    """
+    async for chunk in chunks:
+        digest.update(chunk)
+    return digest
+
+async def lock_storage_paths(session: AsyncSession, paths: List[str]) -> None:
+    """
+    Serialize transactions touching the same storage objects until commit
+
+    Uploads take these locks before referencing a blob, and the outbox worker
+    before re-checking and removing an object. A removal therefore can't land
+    between an upload finding the object already stored and its commit.
+    Locks are taken in key order, so overlapping sets can't deadlock.
+    """
+    if paths:
+        await session.execute(
+            text("""
+                SELECT pg_advisory_xact_lock(key)
+                FROM (SELECT DISTINCT hashtext(path) AS key FROM unnest(CAST(:paths AS text[])) AS path ORDER BY key) keys
+            """),
+            {"paths": list(paths)}
+        )
+
+async def acquire_blobs(session: AsyncSession, blobs: List[dict]) -> Dict[str, bool]:
+    """
+    Take one reference per entry of ``blobs`` (dicts of sha256, size, content_type)
+
+    A single upsert creates missing rows and bumps existing ones; its row locks
+    are held until commit. The blobs' storage paths are locked first (see
+    ``lock_storage_paths``). Returns ``{sha256: stored}``.
+    """
+    rows: Dict[str, dict] = {}
+    for blob in blobs:
+        row = rows.setdefault(blob["sha256"], {
+            "sha256": blob["sha256"],
+            "storage_path": blob_path(blob["sha256"]),
+            "size": blob["size"],
+            "content_type": blob["content_type"],
+            "ref_count": 0,
+            "stored": False,
+        })
+        row["ref_count"] += 1
+    if not rows:
+        return {}
+
+    await lock_storage_paths(session, [row["storage_path"] for row in rows.values()])
+    statement = pg_insert(Blob).values(list(rows.values()))
+    statement = statement.on_conflict_do_update(
+        index_elements=["sha256"],
+        set_={"ref_count": Blob.ref_count + statement.excluded.ref_count}
+    ).returning(Blob.sha256, Blob.stored)
+    result = await session.execute(statement)
+    return dict(result.all())
+
+async def mark_stored(session: AsyncSession, sha256s: List[str]) -> None:
+    if sha256s:
+        await session.execute(
+            update(Blob).where(Blob.sha256.in_(sha256s)).values(stored=True)
+        )
+
+async def write_blob(
+    storage: StorageBackend,
+    sha256: str,
+    size: int,
+    content_type: str,
+    chunks: Callable[[], AsyncIterator[bytes]]
+) -> None:
+    """
+    Write a blob's bytes to storage; an object already there is the same content
+    """
+    try:
+        async with upload_budget.reserve(size):
+            await storage.put_stream(blob_path(sha256), chunks(), content_type=content_type, size=size)
+    except ObjectExists:
+        pass
+
+async def reference_blob(
+    session: AsyncSession,
+    digest: StreamDigest,
+    content_type: str
+) -> Tuple[str, bool]:
+    """
+    Take a reference to already-digested content and commit it
+
+    Committing before the bytes are written means no transaction or lock is
+    held while they upload; the outbox worker leaves referenced blobs alone.
+    Returns the file_url to store and whether the bytes still need writing
+    (``write_blob``, then ``mark_stored`` with the document). If the upload
+    then fails, the caller gives the reference back.
+    """
+    stored = await acquire_blobs(session, [
+        {"sha256": digest.sha256, "size": digest.size, "content_type": content_type}
+    ])
+    await session.commit()
+    return blob_path(digest.sha256), not stored[digest.sha256]
+
+async def release_blob_refs(session: AsyncSession, counts: Dict[str, int]) -> List[str]:
+    """
+    Drop references by sha256 and delete blob rows that reach zero
+
+    Returns the storage paths of deleted rows; queue them for removal.
+    """
+    for sha256, count in counts.items():
+        await session.execute(
+            update(Blob).where(Blob.sha256 == sha256).values(ref_count=Blob.ref_count - count)
+        )
+    result = await session.execute(
+        delete(Blob)
+        .where(Blob.sha256.in_(list(counts)), Blob.ref_count <= 0)
+        .returning(Blob.storage_path)
+    )
+    return list(result.scalars().all())
+
+async def release_document_blobs(session: AsyncSession, *criteria) -> List[str]:
+    """
+    Drop the blob references held by the file nodes matching ``criteria``
+
+    Call before deleting those nodes. Counts are taken and applied in SQL, one
+    UPDATE for every blob involved. Returns the storage paths of blobs no longer
+    referenced; queue them for removal in the same transaction.
+    """
+    references = (
+        select(DocumentNode.file_url, func.count().label("count"))
+        .where(
+            *criteria,
+            DocumentNode.type == DocumentType.FILE,
+            DocumentNode.file_url.startswith(BLOB_PREFIX)
+        )
+        .group_by(DocumentNode.file_url)
+        .subquery()
+    )
+    await session.execute(
+        update(Blob)
+        .where(Blob.storage_path == references.c.file_url)
+        .values(ref_count=Blob.ref_count - references.c.count)
+    )
+    result = await session.execute(
+        delete(Blob)
+        .where(Blob.storage_path.in_(select(references.c.file_url)), Blob.ref_count <= 0)
+        .returning(Blob.storage_path)
+    )
+    return list(result.scalars().all())
+
+async def legacy_file_paths(session: AsyncSession, *criteria) -> List[str]:
+    """
+    Storage paths (with renditions) of matching files stored before deduplication
+
+    Those objects belong to a single DocumentNode and go when it does.
+    """
+    statement = select(DocumentNode.file_url, DocumentNode.file_type).where(
+        *criteria,
+        DocumentNode.type == DocumentType.FILE,
+        DocumentNode.file_url.is_not(None),
+        DocumentNode.file_url.not_like("/demo/%"),
+        DocumentNode.file_url.not_like(f"{BLOB_PREFIX}%")
+    )
+    paths = []
+    for file_url, file_type in (await session.execute(statement)).all():
+        paths.append(file_url)
+        paths.extend(rendition_paths(file_url, file_type))
+    return paths
+
+def blob_object_paths(released: List[str]) -> List[str]:
+    """
+    Storage objects of released blobs, including their renditions
+    """
+    return [path for blob in released for path in (blob, thumbnail_path(blob))]
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded LRU cache whose entries expire at a given time
+
+    Each entry carries its own absolute expiry (``time.time()`` based), so callers
+    can evict at a token's ``exp`` claim or a signed URL's deadline instead of a
+    single global TTL.
+    """
+    def __init__(self, max_size: int, default_ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= now:
+                del self._entries[key]
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: Optional[float] = None,
+        expires_at: Optional[float] = None
+    ) -> None:
+        """
+        Store a value; ``expires_at`` wins over ``ttl``, which wins over the default TTL
+        """
+        if self.max_size <= 0:
+            return
+
+        if expires_at is None:
+            ttl = ttl if ttl is not None else self.default_ttl
+            expires_at = time.time() + ttl if ttl is not None else None
+
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+class SingleFlight:
+    """
+    Coalesces concurrent async calls for the same key into one execution
+
+    The shared call runs as its own task, so a caller that goes away (e.g. a
+    client disconnect) does not cancel the work the other callers are waiting on.
+    """
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Await ``fn()``, or the call already in flight for ``key``
+
+        Returns ``(result, shared)``; ``shared`` is True for callers that joined
+        another caller's call. Exceptions propagate to every caller.
+        """
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task), shared
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every caller has gone away
+            task.exception()
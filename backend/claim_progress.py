@@ -0,0 +1,76 @@
+from typing import List, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import func, insert, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from models import ClaimRequirementProgress, DocumentNode, DocumentType
+
+async def create_requirements(session: AsyncSession, claim_id: str, requirements: List[str]) -> None:
+    """
+    Copy a template's required documents into a new claim's checklist
+
+    Later edits to the template don't change the checklist of existing claims.
+    """
+    rows = [
+        {"claim_id": claim_id, "requirement": requirement, "position": position, "file_count": 0}
+        for position, requirement in enumerate(dict.fromkeys(requirements))
+    ]
+    if rows:
+        await session.execute(insert(ClaimRequirementProgress), rows)
+
+async def check_requirement(session: AsyncSession, claim_id: str, requirement: Optional[str]) -> None:
+    """
+    Reject a tag that isn't on the claim's checklist (None, untagged, is always fine)
+    """
+    if requirement is None:
+        return
+    statement = select(ClaimRequirementProgress.requirement).where(
+        ClaimRequirementProgress.claim_id == claim_id,
+        ClaimRequirementProgress.requirement == requirement
+    )
+    if not (await session.execute(statement)).first():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"'{requirement}' is not a required document of this claim"
+        )
+
+async def count_requirement(session: AsyncSession, claim_id: str, requirement: Optional[str], delta: int) -> None:
+    """
+    Add ``delta`` tagged files to one checklist item, in the caller's transaction
+    """
+    if requirement is None or not delta:
+        return
+    await session.execute(
+        update(ClaimRequirementProgress)
+        .where(
+            ClaimRequirementProgress.claim_id == claim_id,
+            ClaimRequirementProgress.requirement == requirement
+        )
+        .values(file_count=ClaimRequirementProgress.file_count + delta)
+    )
+
+async def release_requirements(session: AsyncSession, *criteria) -> None:
+    """
+    Uncount the tagged files matching ``criteria``; call before deleting them
+
+    Counts are taken and applied in SQL, one UPDATE for every item involved.
+    """
+    tagged = (
+        select(DocumentNode.claim_id, DocumentNode.requirement, func.count().label("count"))
+        .where(
+            *criteria,
+            DocumentNode.type == DocumentType.FILE,
+            DocumentNode.requirement.is_not(None)
+        )
+        .group_by(DocumentNode.claim_id, DocumentNode.requirement)
+        .subquery()
+    )
+    await session.execute(
+        update(ClaimRequirementProgress)
+        .where(
+            ClaimRequirementProgress.claim_id == tagged.c.claim_id,
+            ClaimRequirementProgress.requirement == tagged.c.requirement
+        )
+        .values(file_count=ClaimRequirementProgress.file_count - tagged.c.count)
+    )
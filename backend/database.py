@@ -1,5 +1,7 @@
 import os
-from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -27,19 +29,34 @@ engine = create_engine(
     connect_args={"sslmode": "prefer"}
 )
 
+# Async engine used by the API; psycopg3 speaks asyncio natively, so the same URL works
+async_engine = create_async_engine(
+    DATABASE_URL,
+    echo=True if os.getenv("ENVIRONMENT") == "development" else False,
+    pool_pre_ping=True,
+    pool_recycle=300,
+    connect_args={"sslmode": "prefer"}
+)
+
+# expire_on_commit=False keeps loaded attributes usable after commit without a lazy
+# (and, under asyncio, illegal) implicit refresh
+async_session_maker = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    expire_on_commit=False
+)
+
 # Database session dependency
 def get_session():
     """
-    Database session dependency for FastAPI endpoints
+    Synchronous database session, for scripts such as seed_data.py
     """
     with Session(engine) as session:
         yield session
 
-# Create all tables
-def create_tables():
+async def get_async_session():
     """
-    Create all database tables
+    Database session dependency for FastAPI endpoints
     """
-    # Import all models to register them with SQLModel metadata
-    from models import User, Claim, DocumentNode, ClaimTemplate, Notification
-    SQLModel.metadata.create_all(engine) 
\ No newline at end of file
+    async with async_session_maker() as session:
+        yield session
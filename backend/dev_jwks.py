@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Local JWKS stand-in for offline development and load testing
+
+Generates an RSA signing key and a matching JWKS document, and mints
+Clerk-shaped session tokens signed with it. Point the API at the JWKS file
+and the dev issuer:
+
+    python dev_jwks.py init
+    export CLERK_JWKS_FILE=.dev_jwks/jwks.json
+    export CLERK_ISSUER=https://clerk.dev.local
+    python dev_jwks.py token --sub user_123 --email demo@example.com
+"""
+import argparse
+import json
+import os
+import time
+import uuid
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+DEFAULT_DIR = ".dev_jwks"
+DEFAULT_ISSUER = "https://clerk.dev.local"
+DEFAULT_AUTHORIZED_PARTY = "http://localhost:3000"
+
+def init_keys(directory: str) -> str:
+    """
+    Create a private key and the public JWKS document, returning the JWKS path
+    """
+    os.makedirs(directory, exist_ok=True)
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+    public_pem = private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+
+    kid = f"dev-{uuid.uuid4().hex[:12]}"
+    public_jwk = jwk.construct(public_pem.decode(), "RS256").to_dict()
+    public_jwk.update({"kid": kid, "use": "sig"})
+
+    with open(os.path.join(directory, "private.pem"), "wb") as f:
+        f.write(private_pem)
+    with open(os.path.join(directory, "kid"), "w") as f:
+        f.write(kid)
+
+    jwks_path = os.path.join(directory, "jwks.json")
+    with open(jwks_path, "w") as f:
+        json.dump({"keys": [public_jwk]}, f, indent=2)
+    return jwks_path
+
+def mint_token(
+    directory: str,
+    sub: str,
+    email: str,
+    name: str,
+    ttl: int,
+    issuer: str = DEFAULT_ISSUER,
+    authorized_party: str = DEFAULT_AUTHORIZED_PARTY
+) -> str:
+    """
+    Sign a session token with the local key
+    """
+    with open(os.path.join(directory, "private.pem")) as f:
+        private_pem = f.read()
+    with open(os.path.join(directory, "kid")) as f:
+        kid = f.read().strip()
+
+    now = int(time.time())
+    claims = {
+        "iss": issuer,
+        "azp": authorized_party,
+        "sub": sub,
+        "email": email,
+        "name": name,
+        "iat": now,
+        "nbf": now,
+        "exp": now + ttl,
+    }
+    return jwt.encode(claims, private_pem, algorithm="RS256", headers={"kid": kid})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=DEFAULT_DIR, help="Directory holding the dev key material")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("init", help="Generate a signing key and jwks.json")
+
+    token_parser = subparsers.add_parser("token", help="Mint a signed session token")
+    token_parser.add_argument("--sub", required=True)
+    token_parser.add_argument("--email", default="")
+    token_parser.add_argument("--name", default="")
+    token_parser.add_argument("--ttl", type=int, default=3600, help="Token lifetime in seconds")
+    token_parser.add_argument("--issuer", default=os.getenv("CLERK_ISSUER", DEFAULT_ISSUER))
+    token_parser.add_argument("--azp", default=DEFAULT_AUTHORIZED_PARTY, help="Origin the token is issued to")
+
+    args = parser.parse_args()
+    if args.command == "init":
+        print(init_keys(args.dir))
+    else:
+        print(mint_token(args.dir, args.sub, args.email, args.name, args.ttl, args.issuer, args.azp))
@@ -0,0 +1,160 @@
+import os
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel.ext.asyncio.session import AsyncSession
+from dotenv import load_dotenv
+
+from models import DocumentNode, DocumentStats, DocumentStatus, DocumentType
+
+# Load environment variables
+load_dotenv()
+
+# Bytes of files a single claim may hold (0 disables the quota)
+CLAIM_STORAGE_QUOTA_BYTES = int(os.getenv("CLAIM_STORAGE_QUOTA_BYTES", "0"))
+
+# folder_id of the row holding a whole claim's totals
+CLAIM_SCOPE = ""
+
+STAT_FIELDS = ("file_count", "folder_count", "total_bytes", "error_count", "processing_count")
+
+def stats_scopes(path: str) -> List[str]:
+    """
+    Stats rows a node at ``path`` counts towards: its claim's and every ancestor folder's
+    """
+    return [CLAIM_SCOPE] + path.strip("/").split("/")[:-1]
+
+def node_delta(node: DocumentNode) -> Dict[str, int]:
+    """
+    What a single node adds to the totals it counts towards
+    """
+    if node.type == DocumentType.FOLDER:
+        return {"folder_count": 1}
+    return {
+        "file_count": 1,
+        "total_bytes": node.file_size or 0,
+        "error_count": int(node.status == DocumentStatus.ERROR),
+        "processing_count": int(node.status == DocumentStatus.PROCESSING),
+    }
+
+def scaled(delta: Dict[str, int], factor: int) -> Dict[str, int]:
+    return {field: value * factor for field, value in delta.items()}
+
+def add_delta(deltas: Dict[str, Dict[str, int]], scopes: List[str], delta: Dict[str, int]) -> Dict[str, Dict[str, int]]:
+    """
+    Accumulate ``delta`` into every scope of ``scopes``; returns ``deltas``
+    """
+    for scope in scopes:
+        row = deltas.setdefault(scope, {})
+        for field, value in delta.items():
+            row[field] = row.get(field, 0) + value
+    return deltas
+
+async def subtree_totals(session: AsyncSession, *criteria) -> Dict[str, int]:
+    """
+    Totals of the nodes matching ``criteria`` (e.g. a folder and its subtree), in one aggregate
+    """
+    is_file = DocumentNode.type == DocumentType.FILE
+    statement = select(
+        func.count().filter(is_file),
+        func.count().filter(DocumentNode.type == DocumentType.FOLDER),
+        func.coalesce(func.sum(DocumentNode.file_size).filter(is_file), 0),
+        func.count().filter(is_file, DocumentNode.status == DocumentStatus.ERROR),
+        func.count().filter(is_file, DocumentNode.status == DocumentStatus.PROCESSING)
+    ).where(*criteria)
+    return dict(zip(STAT_FIELDS, (await session.execute(statement)).one()))
+
+async def apply_stats_deltas(session: AsyncSession, claim_id: str, deltas: Dict[str, Dict[str, int]]) -> Optional[int]:
+    """
+    Add ``{scope: {field: delta}}`` to a claim's stats rows with one upsert
+
+    Rows are touched in scope order so concurrent changes can't deadlock, and
+    stay locked until commit. Returns the claim's total bytes afterwards (None
+    when the claim row wasn't touched).
+    """
+    rows = []
+    for scope in sorted(deltas):
+        delta = deltas[scope]
+        if any(delta.values()):
+            rows.append({"claim_id": claim_id, "folder_id": scope, **{
+                field: delta.get(field, 0) for field in STAT_FIELDS
+            }})
+    if not rows:
+        return None
+
+    statement = pg_insert(DocumentStats).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=["claim_id", "folder_id"],
+        set_={field: getattr(DocumentStats, field) + getattr(statement.excluded, field) for field in STAT_FIELDS}
+    ).returning(DocumentStats.folder_id, DocumentStats.total_bytes)
+    totals = dict((await session.execute(statement)).all())
+    return totals.get(CLAIM_SCOPE)
+
+async def count_new_nodes(session: AsyncSession, claim_id: str, nodes: List[DocumentNode]) -> Optional[int]:
+    """
+    Count freshly created nodes towards their claim and ancestor folders
+
+    Returns the claim's total bytes afterwards; pass it to ``enforce_claim_quota``.
+    """
+    if not nodes:
+        return None
+    deltas = {}
+    for node in nodes:
+        add_delta(deltas, stats_scopes(node.path), node_delta(node))
+    return await apply_stats_deltas(session, claim_id, deltas)
+
+async def move_stats(
+    session: AsyncSession,
+    claim_id: str,
+    old_path: str,
+    new_path: str,
+    totals: Dict[str, int]
+) -> None:
+    """
+    Shift a moved node's ``totals`` (its whole subtree for a folder) from its old ancestors to its new ones
+    """
+    deltas = add_delta({}, stats_scopes(old_path), scaled(totals, -1))
+    await apply_stats_deltas(session, claim_id, add_delta(deltas, stats_scopes(new_path), totals))
+
+async def drop_folder_stats(session: AsyncSession, claim_id: str, *criteria) -> None:
+    """
+    Delete the stats rows of the folders matching ``criteria``; call before deleting them
+    """
+    await session.execute(
+        delete(DocumentStats).where(
+            DocumentStats.claim_id == claim_id,
+            DocumentStats.folder_id.in_(
+                select(DocumentNode.id).where(*criteria, DocumentNode.type == DocumentType.FOLDER)
+            )
+        )
+    )
+
+async def get_stats(session: AsyncSession, claim_id: str, folder_id: str = CLAIM_SCOPE) -> Dict[str, int]:
+    """
+    Totals of a claim (or of one folder's subtree) by primary key; zeros if nothing was counted
+    """
+    stats = await session.get(DocumentStats, (claim_id, folder_id))
+    return {field: getattr(stats, field) if stats else 0 for field in STAT_FIELDS}
+
+def enforce_claim_quota(total_bytes: Optional[int]) -> None:
+    """
+    Reject a change that leaves a claim holding more than CLAIM_STORAGE_QUOTA_BYTES
+    """
+    if CLAIM_STORAGE_QUOTA_BYTES and total_bytes is not None and total_bytes > CLAIM_STORAGE_QUOTA_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Claim storage quota of {CLAIM_STORAGE_QUOTA_BYTES} bytes exceeded"
+        )
+
+async def check_claim_quota(session: AsyncSession, claim_id: str, added_bytes: int) -> None:
+    """
+    Cheap up-front quota check before any bytes are written to storage
+
+    Not a guarantee under concurrent uploads; ``enforce_claim_quota`` on the
+    counter returned by the upsert is the authoritative check.
+    """
+    if CLAIM_STORAGE_QUOTA_BYTES:
+        stats = await get_stats(session, claim_id)
+        enforce_claim_quota(stats["total_bytes"] + added_bytes)
@@ -1,14 +1,20 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 import os
 from dotenv import load_dotenv
 
 # Import database and models
-from database import create_tables
+from migrations import run_migrations, LATEST_VERSION
+from blob_cache import blob_cache
+from renditions import shutdown_renditions
+from storage_cleanup import storage_cleanup
+from storage import UploadSizeLimit
+from auth_utils import get_current_user
 from models import *  # Import all models to ensure they are registered
 
 # Import routers
-from routers import claims, documents, users, notifications, templates
+from routers import claims, dashboard, documents, users, notifications, templates
 
 # Load environment variables
 load_dotenv()
@@ -20,6 +26,12 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Refuse oversized uploads before their bodies are read (inside CORS, so the 413 reaches browsers)
+app.add_middleware(UploadSizeLimit, limits={
+    f"/api{documents.router.prefix}{path}": limit
+    for path, limit in documents.UPLOAD_REQUEST_LIMITS.items()
+})
+
 # Configure CORS
 frontend_url = os.getenv("FRONTEND_URL", "http://localhost:3000")
 app.add_middleware(
@@ -36,6 +48,7 @@ app.include_router(documents.router, prefix="/api")
 app.include_router(users.router, prefix="/api")
 app.include_router(notifications.router, prefix="/api")
 app.include_router(templates.router, prefix="/api")
+app.include_router(dashboard.router, prefix="/api")
 
 @app.get("/")
 def read_root():
@@ -43,19 +56,42 @@ def read_root():
 
 @app.get("/health")
 def health_check():
+    # Liveness only: no database or storage round trips
     return {"status": "healthy"}
 
-# Create database tables on startup
+@app.get("/api/metrics")
+async def metrics(current_user: User = Depends(get_current_user)):
+    """
+    Blob cache and storage cleanup counters for this worker
+    """
+    return {
+        "blob_cache": blob_cache.stats(),
+        "storage_cleanup": await storage_cleanup.stats()
+    }
+
+# Apply pending schema migrations on startup
 @app.on_event("startup")
 async def startup_event():
     """
-    Create database tables on application startup
+    Bring the database schema up to date on application startup
     """
     try:
-        create_tables()
-        print("Database tables created successfully")
+        # Blocking DDL (and a wait on another worker's migration lock) stays off the event loop
+        applied = await run_in_threadpool(run_migrations)
+        print(f"Database schema at version {LATEST_VERSION} ({len(applied)} migrations applied)")
     except Exception as e:
-        print(f"Error creating database tables: {e}")
+        print(f"Error migrating database schema: {e}")
+    
+    # Drain queued storage deletes in the background
+    storage_cleanup.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Stop background storage cleanup and the thumbnail rendering worker processes
+    """
+    await storage_cleanup.stop()
+    shutdown_renditions()
 
 if __name__ == "__main__":
     import uvicorn
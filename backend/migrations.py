@@ -0,0 +1,205 @@
+from typing import Callable, List, NamedTuple, Union
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlmodel import SQLModel
+
+from database import engine
+
+# Serializes migration runs across processes starting at the same time
+MIGRATION_LOCK_ID = 0x70617832
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    # SQL statements or callables taking the connection, run in one transaction
+    steps: List[Union[str, Callable[[Connection], None]]]
+
+def create_baseline(connection: Connection) -> None:
+    """
+    Create every table and index the models declare that doesn't exist yet
+    """
+    # Import all models to register them with SQLModel metadata
+    import models  # noqa: F401
+    SQLModel.metadata.create_all(connection)
+
+# Append only; never edit a migration that has shipped. The baseline creates
+# fresh databases from the current models, so later steps must be idempotent
+# (IF NOT EXISTS) to be no-ops there while upgrading older databases.
+MIGRATIONS = [
+    Migration(1, "Baseline schema", [create_baseline]),
+    Migration(2, "Materialized document paths", [
+        "ALTER TABLE documentnode ADD COLUMN IF NOT EXISTS path VARCHAR",
+        "ALTER TABLE documentnode ADD COLUMN IF NOT EXISTS depth INTEGER NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS ix_documentnode_path ON documentnode (path text_pattern_ops)",
+        """
+        WITH RECURSIVE tree AS (
+            SELECT id, '/' || id || '/' AS path, 0 AS depth
+            FROM documentnode WHERE parent_id IS NULL
+            UNION ALL
+            SELECT child.id, tree.path || child.id || '/', tree.depth + 1
+            FROM documentnode child JOIN tree ON child.parent_id = tree.id
+        )
+        UPDATE documentnode SET path = tree.path, depth = tree.depth
+        FROM tree
+        WHERE documentnode.id = tree.id AND documentnode.path IS NULL
+        """,
+    ]),
+    Migration(3, "Lazy tree listing", [
+        "CREATE INDEX IF NOT EXISTS ix_documentnode_children ON documentnode (claim_id, parent_id, type, name, id)",
+    ]),
+    Migration(4, "Document tree versioning", [
+        "ALTER TABLE claim ADD COLUMN IF NOT EXISTS document_version INTEGER NOT NULL DEFAULT 0",
+    ]),
+    Migration(5, "Set-based subtree deletes", [
+        "CREATE INDEX IF NOT EXISTS ix_documentnode_parent_id ON documentnode (parent_id)",
+    ]),
+    Migration(6, "Storage cleanup reference checks", [
+        "CREATE INDEX IF NOT EXISTS ix_documentnode_file_url ON documentnode (file_url)",
+    ]),
+    Migration(7, "Claim listing and notification feed indexes", [
+        "CREATE INDEX IF NOT EXISTS ix_claim_user_updated ON claim (user_id, updated_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_notification_user_created ON notification (user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_notification_user_unread ON notification (user_id, is_read, created_at)",
+    ]),
+    Migration(8, "Claim name prefix search", [
+        "CREATE INDEX IF NOT EXISTS ix_claim_user_name_prefix ON claim (user_id, lower(name) text_pattern_ops)",
+    ]),
+    Migration(9, "Per-claim and per-folder document statistics", [
+        "ALTER TABLE documentnode ADD COLUMN IF NOT EXISTS file_size INTEGER",
+        # Deduplicated files know their size from the blob; older files stay unknown (0 bytes)
+        """
+        UPDATE documentnode SET file_size = blob.size
+        FROM blob
+        WHERE documentnode.file_url = blob.storage_path AND documentnode.file_size IS NULL
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS documentstats (
+            claim_id VARCHAR NOT NULL REFERENCES claim (id),
+            folder_id VARCHAR NOT NULL,
+            file_count INTEGER NOT NULL,
+            folder_count INTEGER NOT NULL,
+            total_bytes BIGINT NOT NULL,
+            error_count INTEGER NOT NULL,
+            processing_count INTEGER NOT NULL,
+            PRIMARY KEY (claim_id, folder_id)
+        )
+        """,
+        # Every node counts towards its claim ('') and each ancestor folder on its path
+        """
+        INSERT INTO documentstats (
+            claim_id, folder_id, file_count, folder_count, total_bytes, error_count, processing_count
+        )
+        SELECT
+            node.claim_id,
+            scope.folder_id,
+            count(*) FILTER (WHERE node.type = 'FILE'),
+            count(*) FILTER (WHERE node.type = 'FOLDER'),
+            coalesce(sum(node.file_size) FILTER (WHERE node.type = 'FILE'), 0),
+            count(*) FILTER (WHERE node.type = 'FILE' AND node.status = 'ERROR'),
+            count(*) FILTER (WHERE node.type = 'FILE' AND node.status = 'PROCESSING')
+        FROM documentnode node
+        CROSS JOIN LATERAL (
+            SELECT '' AS folder_id
+            UNION ALL
+            SELECT unnest((string_to_array(trim(BOTH '/' FROM node.path), '/'))[1:node.depth])
+        ) scope
+        GROUP BY node.claim_id, scope.folder_id
+        ON CONFLICT DO NOTHING
+        """,
+    ]),
+    Migration(10, "Required-document checklist progress", [
+        "ALTER TABLE documentnode ADD COLUMN IF NOT EXISTS requirement VARCHAR",
+        """
+        CREATE TABLE IF NOT EXISTS claimrequirementprogress (
+            claim_id VARCHAR NOT NULL REFERENCES claim (id),
+            requirement VARCHAR NOT NULL,
+            position INTEGER NOT NULL,
+            file_count INTEGER NOT NULL,
+            PRIMARY KEY (claim_id, requirement)
+        )
+        """,
+        # Existing claims get their template's checklist; no file is tagged yet
+        """
+        INSERT INTO claimrequirementprogress (claim_id, requirement, position, file_count)
+        SELECT claim.id, item.requirement, item.position - 1, 0
+        FROM claim
+        JOIN claimtemplate ON claimtemplate.name = claim.template_type
+        CROSS JOIN LATERAL json_array_elements_text(claimtemplate.required_documents::json)
+            WITH ORDINALITY AS item(requirement, position)
+        ON CONFLICT DO NOTHING
+        """,
+    ]),
+    # blob.size (baseline) and documentnode.file_size (migration 9) were created as
+    # INTEGER, which overflows at 2 GiB; widen both
+    Migration(11, "64-bit byte sizes", [
+        "ALTER TABLE blob ALTER COLUMN size TYPE BIGINT",
+        "ALTER TABLE documentnode ALTER COLUMN file_size TYPE BIGINT",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+def current_version(connection: Connection) -> int:
+    """
+    Highest applied migration version (0 for a database without the version table)
+    """
+    if connection.execute(text("SELECT to_regclass('schema_version')")).scalar() is None:
+        return 0
+    return connection.execute(text("SELECT coalesce(max(version), 0) FROM schema_version")).scalar()
+
+def run_migrations() -> List[int]:
+    """
+    Bring the database schema up to date, applying only pending migrations
+
+    An up-to-date database costs a single query. Otherwise an advisory lock
+    makes concurrent starters wait for one runner; each migration commits
+    together with its schema_version row. Returns the versions applied.
+    """
+    with engine.connect() as connection:
+        version = current_version(connection)
+        connection.commit()
+        if version >= LATEST_VERSION:
+            return []
+
+        connection.execute(text("SELECT pg_advisory_lock(:lock_id)"), {"lock_id": MIGRATION_LOCK_ID})
+        connection.commit()
+        try:
+            connection.execute(text("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description VARCHAR NOT NULL,
+                    applied_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+                )
+            """))
+            # Another process may have migrated while we waited for the lock
+            version = current_version(connection)
+            connection.commit()
+
+            applied = []
+            for migration in MIGRATIONS:
+                if migration.version <= version:
+                    continue
+                for step in migration.steps:
+                    if callable(step):
+                        step(connection)
+                    else:
+                        connection.execute(text(step))
+                connection.execute(
+                    text("INSERT INTO schema_version (version, description) VALUES (:version, :description)"),
+                    {"version": migration.version, "description": migration.description}
+                )
+                connection.commit()
+                applied.append(migration.version)
+                print(f"🛠️ Applied migration {migration.version}: {migration.description}")
+            return applied
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": MIGRATION_LOCK_ID})
+            connection.commit()
+
+if __name__ == "__main__":
+    applied = run_migrations()
+    print(f"Database schema at version {LATEST_VERSION} ({len(applied)} migrations applied)")
@@ -1,5 +1,6 @@
 from sqlmodel import SQLModel, Field, Relationship
-from typing import Optional, List
+from sqlalchemy import BigInteger, Index, text
+from typing import Dict, Optional, List
 from datetime import datetime
 from enum import Enum
 import json
@@ -57,8 +58,17 @@ class ClaimBase(SQLModel):
     template_type: str
 
 class Claim(ClaimBase, table=True):
+    __table_args__ = (
+        # A user's claims by recency, with id as the keyset tie-breaker
+        Index("ix_claim_user_updated", "user_id", "updated_at", "id"),
+        # Case-insensitive name prefix search within a user's claims
+        Index("ix_claim_user_name_prefix", "user_id", text("lower(name) text_pattern_ops")),
+    )
+
     id: Optional[str] = Field(default=None, primary_key=True)
     user_id: str = Field(foreign_key="user.id")
+    # Bumped by every change to the claim's document tree; served as the tree's ETag
+    document_version: int = Field(default=0)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     
@@ -86,9 +96,27 @@ class DocumentNodeBase(SQLModel):
     status_icon: Optional[str] = None
 
 class DocumentNode(DocumentNodeBase, table=True):
+    __table_args__ = (
+        # text_pattern_ops lets "path LIKE 'prefix%'" subtree lookups use the index
+        Index("ix_documentnode_path", "path", postgresql_ops={"path": "text_pattern_ops"}),
+        # Keyset pagination of a folder's children in explorer order
+        Index("ix_documentnode_children", "claim_id", "parent_id", "type", "name", "id"),
+        # Backs the parent_id foreign key check when folders are deleted in bulk
+        Index("ix_documentnode_parent_id", "parent_id"),
+        # Reference checks before storage objects are removed
+        Index("ix_documentnode_file_url", "file_url"),
+    )
+    
     id: Optional[str] = Field(default=None, primary_key=True)
     claim_id: str = Field(foreign_key="claim.id")
     parent_id: Optional[str] = Field(default=None, foreign_key="documentnode.id")
+    # Materialized ancestry: "/<root id>/.../<own id>/"; ids never change, so renames keep it valid
+    path: Optional[str] = None
+    depth: int = Field(default=0)
+    # Bytes stored for a file (None for folders and files uploaded before sizes were recorded)
+    file_size: Optional[int] = Field(default=None, sa_type=BigInteger)
+    # Required document of the claim's template this file fulfils
+    requirement: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     
@@ -107,10 +135,59 @@ class DocumentNodeCreate(DocumentNodeBase):
 class DocumentNodeUpdate(SQLModel):
     name: Optional[str] = None
     status: Optional[DocumentStatus] = None
-    file_url: Optional[str] = None
     status_message: Optional[str] = None
     status_icon: Optional[str] = None
     parent_id: Optional[str] = None
+    requirement: Optional[str] = None
+
+# Content-addressed blob shared by every file with the same bytes
+class Blob(SQLModel, table=True):
+    sha256: str = Field(primary_key=True)
+    storage_path: str = Field(unique=True)
+    size: int = Field(sa_type=BigInteger)
+    content_type: Optional[str] = None
+    # Number of DocumentNodes whose file_url is storage_path
+    ref_count: int = Field(default=0)
+    # False until the object has been written to storage
+    stored: bool = Field(default=False)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+# Running totals of a claim's documents ("" folder_id) or of one folder's subtree,
+# kept by delta upserts in the transaction of every document change
+class DocumentStats(SQLModel, table=True):
+    claim_id: str = Field(foreign_key="claim.id", primary_key=True)
+    folder_id: str = Field(default="", primary_key=True)
+    file_count: int = Field(default=0)
+    folder_count: int = Field(default=0)
+    total_bytes: int = Field(default=0, sa_type=BigInteger)
+    error_count: int = Field(default=0)
+    processing_count: int = Field(default=0)
+
+# One checklist item of a claim, copied from its template when the claim is created,
+# with the number of files tagged against it kept up to date by every document change
+class ClaimRequirementProgress(SQLModel, table=True):
+    claim_id: str = Field(foreign_key="claim.id", primary_key=True)
+    requirement: str = Field(primary_key=True)
+    # Order of the requirement in the template's list
+    position: int
+    file_count: int = Field(default=0)
+
+# Storage object awaiting removal, committed together with the rows that referenced it
+class StorageOutbox(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    path: str
+    attempts: int = Field(default=0)
+    next_attempt_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    last_error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ResumableUploadCreate(SQLModel):
+    claim_id: str
+    parent_id: Optional[str] = None
+    filename: str
+    size: int = Field(ge=0)
+    content_type: Optional[str] = None
+    requirement: Optional[str] = None
 
 # Claim Template Model
 class ClaimTemplateBase(SQLModel):
@@ -149,6 +226,13 @@ class NotificationBase(SQLModel):
     is_read: bool = False
 
 class Notification(NotificationBase, table=True):
+    __table_args__ = (
+        # A user's notification feed, newest first
+        Index("ix_notification_user_created", "user_id", "created_at"),
+        # Unread counts and mark-all-read
+        Index("ix_notification_user_unread", "user_id", "is_read", "created_at"),
+    )
+
     id: Optional[str] = Field(default=None, primary_key=True)
     user_id: str = Field(foreign_key="user.id")
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -175,6 +259,14 @@ class ClaimResponse(SQLModel):
     class Config:
         allow_population_by_field_name = True
 
+class ClaimPageResponse(SQLModel):
+    items: List[ClaimResponse]
+    nextCursor: Optional[str] = None
+    # Claims per status under the template/name filters, for the dashboard tiles
+    statusCounts: Dict[str, int]
+    # Claims matching every filter, across all pages
+    total: int
+
 class ClaimTemplateResponse(SQLModel):
     id: str
     name: str
@@ -226,4 +318,28 @@ class NotificationResponse(SQLModel):
     createdAt: datetime = Field(alias="created_at")
     
     class Config:
-        allow_population_by_field_name = True 
\ No newline at end of file
+        allow_population_by_field_name = True 
+
+class DashboardClaimResponse(ClaimResponse):
+    documentCount: int = 0
+    errorCount: int = 0
+
+class DashboardClaimPage(ClaimPageResponse):
+    items: List[DashboardClaimResponse]
+
+class DashboardResponse(SQLModel):
+    user: UserResponse
+    claims: DashboardClaimPage
+    unreadNotificationCount: int
+    templates: List[ClaimTemplateResponse]
+
+class RequirementProgressResponse(SQLModel):
+    requirement: str
+    fileCount: int
+    satisfied: bool
+
+class ClaimProgressResponse(SQLModel):
+    claimId: str
+    required: int
+    completed: int
+    items: List[RequirementProgressResponse]
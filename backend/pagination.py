@@ -0,0 +1,30 @@
+import base64
+import binascii
+import json
+from typing import Any, List
+
+from fastapi import HTTPException, status
+
+def encode_cursor(values: List[Any]) -> str:
+    """
+    Encode the sort key of the last row on a page as an opaque keyset cursor
+    """
+    raw = json.dumps(values, default=str, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """
+    Decode a keyset cursor, rejecting anything that is not a ``size``-item list
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError):
+        values = None
+
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    return values
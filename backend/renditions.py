@@ -0,0 +1,136 @@
+import asyncio
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, List, Optional
+
+from dotenv import load_dotenv
+
+from cache_utils import SingleFlight
+from storage import StorageBackend, StorageError, ObjectNotFound
+
+# Load environment variables
+load_dotenv()
+
+# Thumbnail configuration
+THUMBNAIL_MAX_SIZE = int(os.getenv("THUMBNAIL_MAX_SIZE", "256"))
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "75"))
+# Sources larger than this are not decoded (thumbnail requests get a 404)
+THUMBNAIL_MAX_SOURCE_BYTES = int(os.getenv("THUMBNAIL_MAX_SOURCE_BYTES", str(50 * 1024 * 1024)))
+RENDITION_WORKERS = int(os.getenv("RENDITION_WORKERS", "2"))
+
+THUMBNAIL_SUFFIX = ".thumb.webp"
+THUMBNAIL_MEDIA_TYPE = "image/webp"
+
+# File types Pillow can decode into a thumbnail
+THUMBNAIL_SOURCE_TYPES = {"png", "jpg", "jpeg", "gif", "bmp", "webp", "tif", "tiff"}
+
+def has_thumbnail(file_type: Optional[str]) -> bool:
+    return (file_type or "").lower() in THUMBNAIL_SOURCE_TYPES
+
+def thumbnail_path(file_url: str) -> str:
+    """
+    Storage path of a file's thumbnail, stored next to the original
+    """
+    return f"{file_url}{THUMBNAIL_SUFFIX}"
+
+def rendition_paths(file_url: str, file_type: Optional[str]) -> List[str]:
+    """
+    Storage paths of every rendition that may exist for a file (for deletion)
+    """
+    return [thumbnail_path(file_url)] if has_thumbnail(file_type) else []
+
+def render_thumbnail(data: bytes, max_size: int, quality: int) -> bytes:
+    """
+    Downscale an image to fit ``max_size`` pixels square and encode it as WebP
+
+    Runs in a worker process; must stay a picklable module-level function.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as image:
+        # Let JPEG decode at a reduced scale instead of full resolution
+        image.draft("RGB", (max_size, max_size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_size, max_size))
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+
+        output = io.BytesIO()
+        image.save(output, format="WEBP", quality=quality, method=4)
+        return output.getvalue()
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=RENDITION_WORKERS)
+    return _pool
+
+def shutdown_renditions() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+async def _single_chunk(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+async def _generate_thumbnail(storage: StorageBackend, file_url: str) -> Optional[bytes]:
+    stored = await storage.open_read(file_url)
+    if stored.size is not None and stored.size > THUMBNAIL_MAX_SOURCE_BYTES:
+        await stored.chunks.aclose()
+        return None
+
+    source = bytearray()
+    async for chunk in stored.chunks:
+        source.extend(chunk)
+        if len(source) > THUMBNAIL_MAX_SOURCE_BYTES:
+            # Storage didn't report the size up front
+            await stored.chunks.aclose()
+            return None
+
+    loop = asyncio.get_running_loop()
+    try:
+        thumbnail = await loop.run_in_executor(
+            get_pool(), render_thumbnail, bytes(source), THUMBNAIL_MAX_SIZE, THUMBNAIL_QUALITY
+        )
+    except Exception as e:
+        # Corrupt or unsupported image
+        print(f"⚠️ Thumbnail rendering failed for {file_url}: {str(e)}")
+        return None
+
+    try:
+        await storage.put_stream(
+            thumbnail_path(file_url),
+            _single_chunk(thumbnail),
+            content_type=THUMBNAIL_MEDIA_TYPE,
+            size=len(thumbnail)
+        )
+    except StorageError as e:
+        # Most likely a concurrent render on another node already stored it
+        print(f"⚠️ Could not store thumbnail for {file_url}: {str(e)}")
+    return thumbnail
+
+_renders = SingleFlight()
+
+async def generate_thumbnail(storage: StorageBackend, file_url: str) -> Optional[bytes]:
+    """
+    Render and store a file's thumbnail, returning its bytes (None if it can't be made)
+
+    Concurrent requests for the same file share one render.
+    """
+    thumbnail, _ = await _renders.do(file_url, lambda: _generate_thumbnail(storage, file_url))
+    return thumbnail
+
+async def generate_thumbnail_task(storage: StorageBackend, file_url: str) -> None:
+    """
+    Background task run after an upload; failures only mean a lazy render later
+    """
+    try:
+        await generate_thumbnail(storage, file_url)
+    except ObjectNotFound:
+        pass
+    except Exception as e:
+        print(f"⚠️ Thumbnail generation failed for {file_url}: {str(e)}")
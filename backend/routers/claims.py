@@ -1,15 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session, select
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlmodel import select
+from sqlalchemy import bindparam, delete, func, literal, tuple_
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 import uuid
+import os
+from dotenv import load_dotenv
 from models import (
     Claim, ClaimCreate, ClaimUpdate, User, ClaimTemplate,
-    ClaimResponse, DocumentNode, DocumentType
+    ClaimResponse, ClaimPageResponse, ClaimStatus, DocumentNode, DocumentStats,
+    ClaimRequirementProgress, ClaimProgressResponse, RequirementProgressResponse
 )
-from database import get_session
+from database import get_async_session
 from auth_utils import get_current_user
-from supabase_client import get_supabase_client
+from pagination import encode_cursor, decode_cursor
+from storage_cleanup import storage_cleanup, enqueue_deletes
+from blob_store import release_document_blobs, legacy_file_paths, blob_object_paths
+from claim_progress import create_requirements
+
+# Load environment variables
+load_dotenv()
+
+# Claim listing limits
+MAX_CLAIM_PAGE_SIZE = int(os.getenv("MAX_CLAIM_PAGE_SIZE", "200"))
+
+# Sortable columns; id breaks ties so every row has a unique keyset position
+CLAIM_SORT_COLUMNS = {
+    "updated_at": Claim.updated_at,
+    "created_at": Claim.created_at,
+    "name": Claim.name,
+}
 
 router = APIRouter(
     prefix="/claims",
@@ -32,20 +53,183 @@ def claim_to_response(claim: Claim) -> ClaimResponse:
 @router.get("/", response_model=List[ClaimResponse])
 async def get_claims(
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Get all claims for the authenticated user
     """
-    statement = select(Claim).where(Claim.user_id == current_user.id)
-    claims = session.exec(statement).all()
+    statement = select(Claim).where(Claim.user_id == current_user.id).order_by(
+        Claim.updated_at.desc(), Claim.id.desc()
+    )
+    claims = (await session.exec(statement)).all()
     return [claim_to_response(claim) for claim in claims]
 
+def decode_claim_cursor(cursor: str, sort: str, order: str) -> tuple:
+    """
+    Decode a claims page cursor into the (sort value, id) of the last row served
+    """
+    cursor_sort, cursor_order, value, claim_id = decode_cursor(cursor, 4)
+    try:
+        # A cursor only continues the listing it was issued for
+        if (cursor_sort, cursor_order) != (sort, order) or not isinstance(claim_id, str):
+            raise ValueError
+        if sort != "name":
+            value = datetime.fromisoformat(value)
+        elif not isinstance(value, str):
+            raise ValueError
+    except (TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    return value, claim_id
+
+async def load_claims_page(
+    session: AsyncSession,
+    user_id: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    status_filter: Optional[ClaimStatus] = None,
+    template_type: Optional[str] = None,
+    q: Optional[str] = None,
+    sort: str = "updated_at",
+    order: str = "desc"
+) -> Tuple[List[Claim], Optional[str], Dict[str, int], int]:
+    """
+    Load one keyset page of a user's claims
+
+    Returns the page, the cursor of the next page (None on the last one), the
+    per-status counts and the number of claims matching every filter.
+    """
+    filters = [Claim.user_id == user_id]
+    if template_type:
+        filters.append(Claim.template_type == template_type)
+    if q:
+        # Escape LIKE wildcards so the prefix is matched literally. The pattern is
+        # rendered inline rather than bound: only a constant prefix lets the planner
+        # turn LIKE into a range scan of ix_claim_user_name_prefix (text_pattern_ops),
+        # and a cached generic plan for a prepared statement would never see one.
+        prefix = q.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        filters.append(func.lower(Claim.name).like(
+            bindparam("name_prefix", f"{prefix}%", literal_execute=True), escape="\\"
+        ))
+    
+    count_statement = select(Claim.status, func.count()).where(*filters).group_by(Claim.status)
+    counts = dict((await session.exec(count_statement)).all())
+    status_counts = {claim_status.value: counts.get(claim_status, 0) for claim_status in ClaimStatus}
+    
+    if status_filter:
+        filters.append(Claim.status == status_filter)
+        total = status_counts[status_filter.value]
+    else:
+        total = sum(status_counts.values())
+    
+    sort_column = CLAIM_SORT_COLUMNS[sort]
+    sort_key = tuple_(sort_column, Claim.id)
+    if cursor:
+        value, claim_id = decode_claim_cursor(cursor, sort, order)
+        after = tuple_(literal(value, sort_column.type), literal(claim_id))
+        filters.append(sort_key < after if order == "desc" else sort_key > after)
+    
+    if order == "desc":
+        ordering = (sort_column.desc(), Claim.id.desc())
+    else:
+        ordering = (sort_column.asc(), Claim.id.asc())
+    
+    statement = select(Claim).where(*filters).order_by(*ordering).limit(limit + 1)
+    page = (await session.exec(statement)).all()
+    has_more = len(page) > limit
+    page = page[:limit]
+    
+    next_cursor = None
+    if has_more:
+        last = page[-1]
+        next_cursor = encode_cursor([sort, order, getattr(last, sort), last.id])
+    
+    return page, next_cursor, status_counts, total
+
+@router.get("/page", response_model=ClaimPageResponse)
+async def get_claims_page(
+    limit: int = Query(50, ge=1, le=MAX_CLAIM_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status_filter: Optional[ClaimStatus] = Query(None, alias="status"),
+    template_type: Optional[str] = None,
+    q: Optional[str] = Query(None, max_length=200),
+    sort: str = Query("updated_at", pattern="^(updated_at|created_at|name)$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Get one page of the authenticated user's claims
+
+    Claims are keyset-paginated on (``sort``, id); pass ``nextCursor`` back as
+    ``cursor`` for the next page. ``status`` and ``template_type`` filter
+    exactly, ``q`` matches a case-insensitive name prefix. ``statusCounts``
+    comes from one aggregate over the template/name filters (not ``status``),
+    so every tile stays populated while one status is selected.
+    """
+    page, next_cursor, status_counts, total = await load_claims_page(
+        session, current_user.id, limit, cursor, status_filter, template_type, q, sort, order
+    )
+    return ClaimPageResponse(
+        items=[claim_to_response(claim) for claim in page],
+        nextCursor=next_cursor,
+        statusCounts=status_counts,
+        total=total
+    )
+
+@router.get("/progress", response_model=List[ClaimProgressResponse])
+async def get_claims_progress(
+    claim_ids: List[str] = Query(..., alias="claim_id"),
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Required-document checklist progress of several claims (repeat ``claim_id``)
+
+    Served from the per-claim checklist counters in one query, without loading
+    any documents. Claims that don't exist or aren't the user's are left out.
+    """
+    claim_ids = list(dict.fromkeys(claim_ids))
+    if len(claim_ids) > MAX_CLAIM_PAGE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_CLAIM_PAGE_SIZE} claims per request"
+        )
+    
+    # Outer join so owned claims without requirements are still reported
+    statement = (
+        select(Claim.id, ClaimRequirementProgress.requirement, ClaimRequirementProgress.file_count)
+        .outerjoin(ClaimRequirementProgress, ClaimRequirementProgress.claim_id == Claim.id)
+        .where(Claim.id.in_(claim_ids), Claim.user_id == current_user.id)
+        .order_by(Claim.id, ClaimRequirementProgress.position)
+    )
+    items = {}
+    for claim_id, requirement, file_count in (await session.exec(statement)).all():
+        claim_items = items.setdefault(claim_id, [])
+        if requirement is not None:
+            claim_items.append(RequirementProgressResponse(
+                requirement=requirement,
+                fileCount=file_count,
+                satisfied=file_count > 0
+            ))
+    
+    return [
+        ClaimProgressResponse(
+            claimId=claim_id,
+            required=len(items[claim_id]),
+            completed=sum(item.satisfied for item in items[claim_id]),
+            items=items[claim_id]
+        )
+        for claim_id in claim_ids if claim_id in items
+    ]
+
 @router.get("/{claim_id}", response_model=ClaimResponse)
 async def get_claim(
     claim_id: str,
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Get a single claim by ID
@@ -54,7 +238,7 @@ async def get_claim(
         Claim.id == claim_id,
         Claim.user_id == current_user.id
     )
-    claim = session.exec(statement).first()
+    claim = (await session.exec(statement)).first()
     
     if not claim:
         raise HTTPException(
@@ -68,7 +252,7 @@ async def get_claim(
 async def create_claim(
     claim_data: ClaimCreate,
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Create a new claim
@@ -77,7 +261,7 @@ async def create_claim(
     template_statement = select(ClaimTemplate).where(
         ClaimTemplate.id == claim_data.template_id
     )
-    template = session.exec(template_statement).first()
+    template = (await session.exec(template_statement)).first()
     
     if not template:
         raise HTTPException(
@@ -97,8 +281,9 @@ async def create_claim(
     )
     
     session.add(new_claim)
-    session.commit()
-    session.refresh(new_claim)
+    await create_requirements(session, new_claim.id, template.required_documents_list)
+    await session.commit()
+    await session.refresh(new_claim)
     
     return claim_to_response(new_claim)
 
@@ -107,7 +292,7 @@ async def update_claim(
     claim_id: str,
     claim_update: ClaimUpdate,
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Update a claim's details (e.g., rename)
@@ -116,7 +301,7 @@ async def update_claim(
         Claim.id == claim_id,
         Claim.user_id == current_user.id
     )
-    claim = session.exec(statement).first()
+    claim = (await session.exec(statement)).first()
     
     if not claim:
         raise HTTPException(
@@ -132,8 +317,8 @@ async def update_claim(
     claim.updated_at = datetime.utcnow()
     
     session.add(claim)
-    session.commit()
-    session.refresh(claim)
+    await session.commit()
+    await session.refresh(claim)
     
     return claim_to_response(claim)
 
@@ -141,7 +326,7 @@ async def update_claim(
 async def delete_claim(
     claim_id: str,
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Delete a claim and all its associated documents
@@ -150,7 +335,7 @@ async def delete_claim(
         Claim.id == claim_id,
         Claim.user_id == current_user.id
     )
-    claim = session.exec(statement).first()
+    claim = (await session.exec(statement)).first()
     
     if not claim:
         raise HTTPException(
@@ -158,33 +343,23 @@ async def delete_claim(
             detail="Claim not found"
         )
     
-    # Get all documents for this claim
-    documents_statement = select(DocumentNode).where(DocumentNode.claim_id == claim_id)
-    documents = session.exec(documents_statement).all()
-    
-    # Delete files from Supabase Storage first
-    supabase = get_supabase_client()
-    if supabase:
-        files_to_delete = []
-        for doc in documents:
-            if doc.type == DocumentType.FILE and doc.file_url and not doc.file_url.startswith("/demo/"):
-                files_to_delete.append(doc.file_url)
-        
-        if files_to_delete:
-            try:
-                # Delete files from Supabase Storage
-                result = supabase.storage.from_("documents").remove(files_to_delete)
-                print(f"🗑️ Deleted {len(files_to_delete)} files from Supabase Storage")
-            except Exception as e:
-                print(f"⚠️ Warning: Failed to delete some files from Supabase Storage: {str(e)}")
-                # Continue with database deletion even if storage deletion fails
-    
-    # Delete all documents from database (this will cascade delete if configured)
-    for doc in documents:
-        session.delete(doc)
-    
-    # Delete claim from database
-    session.delete(claim)
-    session.commit()
+    claim_documents = DocumentNode.claim_id == claim_id
+    
+    # Files stored before deduplication have objects of their own
+    files_to_delete = await legacy_file_paths(session, claim_documents)
+    
+    # Shared blobs only go away with their last reference
+    released = await release_document_blobs(session, claim_documents)
+    
+    # Set-based deletes: one statement each for the stats, the checklist, the documents and the claim
+    await session.execute(delete(DocumentStats).where(DocumentStats.claim_id == claim_id))
+    await session.execute(delete(ClaimRequirementProgress).where(ClaimRequirementProgress.claim_id == claim_id))
+    await session.execute(delete(DocumentNode).where(claim_documents))
+    await session.execute(delete(Claim).where(Claim.id == claim_id))
+    
+    # Storage objects go in the same transaction, removed by the cleanup worker after commit
+    await enqueue_deletes(session, files_to_delete + blob_object_paths(released))
+    await session.commit()
+    storage_cleanup.wake()
     
     return {"message": "Claim and all associated files deleted successfully"} 
\ No newline at end of file
@@ -0,0 +1,96 @@
+from fastapi import APIRouter, Depends, Query
+from sqlmodel import select
+from sqlalchemy import func
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from models import (
+    ClaimTemplate, DocumentStats, Notification, User,
+    DashboardClaimPage, DashboardClaimResponse, DashboardResponse, UserResponse
+)
+from database import get_async_session
+from auth_utils import get_current_user
+from document_stats import CLAIM_SCOPE
+from routers.claims import MAX_CLAIM_PAGE_SIZE, claim_to_response, load_claims_page
+from routers.templates import template_to_response
+
+router = APIRouter(
+    prefix="/dashboard",
+    tags=["dashboard"],
+)
+
+async def load_dashboard_claims(session: AsyncSession, user_id: str, limit: int) -> DashboardClaimPage:
+    """
+    First page of a user's claims, each with its file and error counts
+    """
+    page, next_cursor, status_counts, total = await load_claims_page(session, user_id, limit)
+    
+    # Claim-level counters, one primary-key row per claim on the page
+    file_counts = {}
+    if page:
+        count_statement = select(
+            DocumentStats.claim_id, DocumentStats.file_count, DocumentStats.error_count
+        ).where(
+            DocumentStats.claim_id.in_([claim.id for claim in page]),
+            DocumentStats.folder_id == CLAIM_SCOPE
+        )
+        file_counts = {
+            claim_id: (documents, errors)
+            for claim_id, documents, errors in (await session.exec(count_statement)).all()
+        }
+    
+    items = []
+    for claim in page:
+        documents, errors = file_counts.get(claim.id, (0, 0))
+        items.append(DashboardClaimResponse(
+            **claim_to_response(claim).model_dump(),
+            documentCount=documents,
+            errorCount=errors
+        ))
+    
+    return DashboardClaimPage(
+        items=items,
+        nextCursor=next_cursor,
+        statusCounts=status_counts,
+        total=total
+    )
+
+async def count_unread_notifications(session: AsyncSession, user_id: str) -> int:
+    statement = select(func.count()).select_from(Notification).where(
+        Notification.user_id == user_id,
+        Notification.is_read == False
+    )
+    return (await session.exec(statement)).one()
+
+@router.get("/", response_model=DashboardResponse)
+async def get_dashboard(
+    limit: int = Query(50, ge=1, le=MAX_CLAIM_PAGE_SIZE),
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Everything the dashboard shows on load, in one round trip
+
+    The user is authenticated once; the claims page (with per-claim file and
+    error counts), the unread notification count and the templates are then
+    read one after another on the request's session, so a dashboard load
+    holds a single pooled connection. ``claims.nextCursor`` continues with
+    GET /claims/page.
+    """
+    claims = await load_dashboard_claims(session, current_user.id, limit)
+    unread_count = await count_unread_notifications(session, current_user.id)
+    templates = await session.exec(select(ClaimTemplate))
+    
+    return DashboardResponse(
+        user=UserResponse(
+            id=current_user.id,
+            name=current_user.name,
+            email=current_user.email,
+            company=current_user.company,
+            clerkUserId=current_user.clerk_user_id,
+            createdAt=current_user.created_at,
+            updatedAt=current_user.updated_at
+        ),
+        claims=claims,
+        unreadNotificationCount=unread_count,
+        templates=[template_to_response(template) for template in templates.all()]
+    )
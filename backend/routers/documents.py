@@ -1,23 +1,52 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
-from fastapi.responses import FileResponse, StreamingResponse
-from sqlmodel import Session, select
-from typing import List, Optional
-from datetime import datetime
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, UploadFile, File, Form, Query, Header, Request, Response
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+from sqlmodel import select
+from sqlalchemy import and_, delete, func, insert, literal, or_, text, tuple_, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Dict, List, Optional
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from urllib.parse import quote
+import asyncio
+import time
 import uuid
 import os
-import io
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
 from models import (
-    DocumentNode, DocumentNodeCreate, DocumentNodeUpdate, 
+    DocumentNode, DocumentNodeCreate, DocumentNodeUpdate, ResumableUploadCreate,
     User, Claim, DocumentType, DocumentStatus
 )
-from database import get_session
+from database import get_async_session
 from auth_utils import get_current_user
-from supabase_client import get_supabase_client, is_supabase_configured
+from pagination import encode_cursor, decode_cursor
+from storage import (
+    get_storage, check_upload_size, iter_upload_file,
+    StorageBackend, LocalStorage, StreamDigest, ByteRange, ObjectNotFound, RangeNotSatisfiable,
+    get_signed_url, signed_urls_enabled, open_file, open_read_shared, UPLOAD_CHUNK_SIZE,
+    MAX_UPLOAD_BYTES, MULTIPART_OVERHEAD_BYTES
+)
+from blob_cache import blob_cache
+from storage_cleanup import storage_cleanup, enqueue_deletes
+from blob_store import (
+    blob_path, digest_stream, acquire_blobs, mark_stored, write_blob, reference_blob,
+    release_blob_refs, release_document_blobs, legacy_file_paths, blob_object_paths
+)
+from renditions import (
+    has_thumbnail, thumbnail_path, generate_thumbnail,
+    generate_thumbnail_task, THUMBNAIL_MEDIA_TYPE
+)
+from upload_sessions import upload_sessions
+from claim_progress import check_requirement, count_requirement, release_requirements
+from document_stats import (
+    CLAIM_SCOPE, CLAIM_STORAGE_QUOTA_BYTES, node_delta, subtree_totals, apply_stats_deltas,
+    add_delta, scaled, stats_scopes, count_new_nodes, move_stats, drop_folder_stats, get_stats,
+    enforce_claim_quota, check_claim_quota
+)
+from zip_export import archive_entries, stream_zip
 
 router = APIRouter(
     prefix="/documents",
@@ -25,6 +54,57 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+# Moves and deletes within one claim take turns (advisory lock class, keyed by claim id)
+TREE_LOCK_CLASS = 0x70617833
+
+# Batch upload limits
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "500"))
+BATCH_UPLOAD_CONCURRENCY = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", "8"))
+
+# Largest request bodies of the multipart upload routes, refused early by storage.UploadSizeLimit
+UPLOAD_REQUEST_LIMITS = {
+    "/upload": MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+    "/upload/batch": MAX_BATCH_FILES * (MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES),
+}
+
+# Lazy tree listing limits
+MAX_TREE_DEPTH = int(os.getenv("MAX_TREE_DEPTH", "5"))
+MAX_TREE_PAGE_SIZE = int(os.getenv("MAX_TREE_PAGE_SIZE", "500"))
+
+def thumbnail_version(document) -> str:
+    """
+    Changes whenever the file's row does, so a thumbnail URL carrying it can be cached for good
+    """
+    return f"{document.updated_at:%Y%m%d%H%M%S%f}"
+
+def thumbnail_url(doc: DocumentNode) -> Optional[str]:
+    if not has_thumbnail(doc.file_type) or not doc.file_url or doc.file_url.startswith("/demo/"):
+        return None
+    return f"/api/documents/{doc.id}/thumbnail?v={thumbnail_version(doc)}"
+
+def document_to_dict(doc: DocumentNode) -> dict:
+    """
+    Serialize a DocumentNode the way the file explorer expects it
+    """
+    return {
+        "id": doc.id,
+        "name": doc.name,
+        "type": doc.type,
+        "claimId": doc.claim_id,
+        "parentId": doc.parent_id,
+        "status": doc.status,
+        "fileUrl": doc.file_url,
+        "fileType": doc.file_type,
+        "size": doc.file_size,
+        "requirement": doc.requirement,
+        "createdAt": doc.created_at.isoformat(),
+        "updatedAt": doc.updated_at.isoformat(),
+        "statusMessage": doc.status_message,
+        "statusIcon": doc.status_icon,
+        "thumbnailUrl": thumbnail_url(doc),
+        "children": []
+    }
+
 def build_document_tree(documents: List[DocumentNode]) -> List[dict]:
     """
     Helper function to build document tree structure
@@ -34,22 +114,7 @@ def build_document_tree(documents: List[DocumentNode]) -> List[dict]:
     
     # Create a map of all documents
     for doc in documents:
-        doc_dict = {
-            "id": doc.id,
-            "name": doc.name,
-            "type": doc.type,
-            "claimId": doc.claim_id,
-            "parentId": doc.parent_id,
-            "status": doc.status,
-            "fileUrl": doc.file_url,
-            "fileType": doc.file_type,
-            "createdAt": doc.created_at.isoformat(),
-            "updatedAt": doc.updated_at.isoformat(),
-            "statusMessage": doc.status_message,
-            "statusIcon": doc.status_icon,
-            "children": []
-        }
-        doc_map[doc.id] = doc_dict
+        doc_map[doc.id] = document_to_dict(doc)
     
     # Build the tree structure
     for doc_dict in doc_map.values():
@@ -62,21 +127,462 @@ def build_document_tree(documents: List[DocumentNode]) -> List[dict]:
     
     return root_docs
 
+async def bump_document_version(session: AsyncSession, claim_id: str) -> None:
+    """
+    Invalidate cached document trees of a claim; call before committing any tree change
+    """
+    await session.execute(
+        update(Claim)
+        .where(Claim.id == claim_id)
+        .values(document_version=Claim.document_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Check an If-None-Match header against an ETag (weak comparison)
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in candidates)
+
+def file_validators(document) -> dict:
+    """
+    ETag and Last-Modified of a stored file, derived from its row alone
+    """
+    # Microseconds in the ETag: changes within the same second must still change it
+    return {
+        "ETag": f'"{document.id}-{document.updated_at:%Y%m%d%H%M%S%f}"',
+        "Last-Modified": format_datetime(document.updated_at.replace(tzinfo=timezone.utc), usegmt=True)
+    }
+
+def not_modified(
+    if_none_match: Optional[str],
+    if_modified_since: Optional[str],
+    etag: str,
+    updated_at: datetime
+) -> bool:
+    """
+    Evaluate a conditional GET; If-None-Match takes precedence over If-Modified-Since
+    """
+    if if_none_match:
+        return etag_matches(if_none_match, etag)
+    if not if_modified_since:
+        return False
+    
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates have one-second resolution
+    return updated_at.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+def node_path(parent: Optional[DocumentNode], node_id: str) -> str:
+    """
+    Materialized path of a node created under ``parent`` (None for the claim root)
+    """
+    return f"{parent.path if parent else '/'}{node_id}/"
+
+def subtree_filter(node: DocumentNode):
+    """
+    WHERE clause matching ``node`` and all of its descendants via the path index
+    """
+    # Paths are built from generated "doc-<uuid>" ids, so they contain no LIKE wildcards
+    return and_(
+        DocumentNode.claim_id == node.claim_id,
+        DocumentNode.path.startswith(node.path)
+    )
+
+async def lock_document(
+    session: AsyncSession,
+    document: DocumentNode,
+    subtree: bool = False
+) -> DocumentNode:
+    """
+    Lock a document's row before changing it, refreshing its path; raises 404 if it's gone
+
+    With ``subtree`` (moves and deletes) the claim's other moves and deletes
+    are waited out first, so two moves can't cross each other, and a folder's
+    descendants are locked as well. That waits for uploads into the subtree,
+    which hold their parent FOR SHARE, and holds off new ones until commit,
+    so statements run afterwards see every child.
+    """
+    if subtree:
+        await session.execute(
+            text("SELECT pg_advisory_xact_lock(:lock_class, hashtext(:claim_id))"),
+            {"lock_class": TREE_LOCK_CLASS, "claim_id": document.claim_id}
+        )
+    
+    statement = (
+        select(DocumentNode)
+        .where(DocumentNode.id == document.id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    locked = (await session.exec(statement)).first()
+    if not locked:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+    
+    if subtree and locked.type == DocumentType.FOLDER:
+        await session.execute(
+            select(DocumentNode.id).where(subtree_filter(locked)).with_for_update()
+        )
+    return locked
+
+async def get_target_folder(
+    session: AsyncSession,
+    document: DocumentNode,
+    new_parent_id: Optional[str]
+) -> Optional[DocumentNode]:
+    """
+    Load and validate the folder a document is being moved into (None for root)
+
+    The folder stays locked until commit; lock the document (with its subtree) first.
+    """
+    if not new_parent_id:
+        return None
+    
+    parent_statement = (
+        select(DocumentNode)
+        .where(
+            DocumentNode.id == new_parent_id,
+            DocumentNode.claim_id == document.claim_id
+        )
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    parent = (await session.exec(parent_statement)).first()
+    
+    if not parent:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="New parent folder not found"
+        )
+    
+    if parent.type != DocumentType.FOLDER:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Parent must be a folder"
+        )
+    
+    return parent
+
+async def relocate_document(
+    session: AsyncSession,
+    document: DocumentNode,
+    new_parent: Optional[DocumentNode]
+) -> None:
+    """
+    Re-parent a document and rewrite the paths of its whole subtree in one UPDATE
+
+    Expects ``lock_document(..., subtree=True)`` to have run, so the paths
+    compared and rewritten here can't change underneath.
+    """
+    old_prefix = document.path
+    new_prefix = node_path(new_parent, document.id)
+    
+    if new_parent and new_parent.path.startswith(old_prefix):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cannot move a folder into itself or one of its subfolders"
+        )
+    
+    depth_delta = (new_parent.depth + 1 if new_parent else 0) - document.depth
+    if new_prefix != old_prefix:
+        await session.execute(
+            update(DocumentNode)
+            .where(subtree_filter(document))
+            .values(
+                path=literal(new_prefix) + func.substr(DocumentNode.path, len(old_prefix) + 1),
+                depth=DocumentNode.depth + depth_delta
+            )
+            .execution_options(synchronize_session=False)
+        )
+    
+    document.parent_id = new_parent.id if new_parent else None
+    document.path = new_prefix
+    document.depth += depth_delta
+
+async def move_document_stats(
+    session: AsyncSession,
+    document: DocumentNode,
+    new_parent: Optional[DocumentNode]
+) -> None:
+    """
+    Relocate a document and carry its subtree's totals over to its new ancestors
+    """
+    old_path = document.path
+    if document.type == DocumentType.FOLDER:
+        totals = await subtree_totals(session, subtree_filter(document))
+    else:
+        totals = node_delta(document)
+    await relocate_document(session, document, new_parent)
+    await move_stats(session, document.claim_id, old_path, document.path, totals)
+
+async def get_owned_file(session: AsyncSession, document_id: str, user: User):
+    """
+    Load just the columns needed to serve a file owned by ``user``, or raise 404
+
+    One primary-key lookup, so conditional requests are answered without
+    loading the whole row or touching storage.
+    """
+    statement = select(
+        DocumentNode.id, DocumentNode.name, DocumentNode.file_type,
+        DocumentNode.file_url, DocumentNode.updated_at
+    ).join(Claim).where(
+        DocumentNode.id == document_id,
+        Claim.user_id == user.id,
+        DocumentNode.type == DocumentType.FILE
+    )
+    document = (await session.exec(statement)).first()
+    
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    return document
+
+async def get_owned_claim(session: AsyncSession, claim_id: str, user: User) -> Claim:
+    """
+    Load a claim owned by ``user`` or raise 404
+    """
+    claim_statement = select(Claim).where(
+        Claim.id == claim_id,
+        Claim.user_id == user.id
+    )
+    claim = (await session.exec(claim_statement)).first()
+    
+    if not claim:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Claim not found"
+        )
+    return claim
+
+async def get_parent_folder(
+    session: AsyncSession,
+    claim_id: str,
+    parent_id: Optional[str],
+    lock: bool = False
+) -> Optional[DocumentNode]:
+    """
+    Load the folder new documents go into (None for the claim root) or raise 404
+
+    Load it with ``lock`` right before inserting children: the row is held FOR
+    SHARE until commit, so a move or delete of the folder (or an ancestor)
+    can't rewrite its path in between, and a finished one is seen.
+    """
+    if not parent_id:
+        return None
+    
+    parent_statement = select(DocumentNode).where(
+        DocumentNode.id == parent_id,
+        DocumentNode.claim_id == claim_id
+    )
+    if lock:
+        parent_statement = parent_statement.with_for_update(read=True).execution_options(populate_existing=True)
+    parent = (await session.exec(parent_statement)).first()
+    
+    if not parent:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Parent folder not found"
+        )
+    return parent
+
+def file_extension_of(filename: str) -> Optional[str]:
+    return filename.split('.')[-1].lower() if '.' in filename else None
+
+def new_file_node(
+    claim_id: str,
+    parent: Optional[DocumentNode],
+    filename: str,
+    file_url: str,
+    file_type: Optional[str],
+    file_size: int,
+    upload_status: DocumentStatus,
+    requirement: Optional[str] = None
+) -> DocumentNode:
+    """
+    Build (but don't add) the DocumentNode for an uploaded file
+    """
+    file_id = f"doc-{uuid.uuid4()}"
+    return DocumentNode(
+        id=file_id,
+        name=filename,
+        type=DocumentType.FILE,
+        claim_id=claim_id,
+        parent_id=parent.id if parent else None,
+        path=node_path(parent, file_id),
+        depth=parent.depth + 1 if parent else 0,
+        status=upload_status,
+        file_url=file_url,
+        file_type=file_type,
+        file_size=file_size,
+        requirement=requirement,
+        created_at=datetime.utcnow(),
+        updated_at=datetime.utcnow()
+    )
+
+def uploaded_file_response(document: DocumentNode, digest: Optional[StreamDigest]) -> dict:
+    """
+    Serialize a freshly uploaded file, including the streamed size and checksum
+    """
+    response = document_to_dict(document)
+    response["size"] = digest.size if digest else None
+    response["checksum"] = f"sha256:{digest.sha256}" if digest else None
+    return response
+
+async def give_back_blob_refs(session: AsyncSession, counts: Dict[str, int]) -> None:
+    """
+    Return the committed blob references of an upload that failed afterwards
+
+    Rolls back whatever the upload left open; blobs no longer referenced are
+    queued for removal.
+    """
+    await session.rollback()
+    released = await release_blob_refs(session, counts)
+    await enqueue_deletes(session, blob_object_paths(released))
+    await session.commit()
+    if released:
+        storage_cleanup.wake()
+
+# Children are listed folders first (the enum sorts FOLDER before FILE), then by name
+CHILD_ORDER = (DocumentNode.type, DocumentNode.name, DocumentNode.id)
+
+async def load_document_level(
+    session: AsyncSession,
+    claim_id: str,
+    parent: Optional[DocumentNode],
+    depth: int,
+    limit: int,
+    cursor: Optional[str]
+) -> dict:
+    """
+    Load one page of a folder's children, plus up to ``depth - 1`` nested levels
+    below the folders on that page (each capped at ``limit`` children per folder)
+    """
+    # Page of direct children, keyset-paginated on (type, name, id)
+    filters = [
+        DocumentNode.claim_id == claim_id,
+        DocumentNode.parent_id == parent.id if parent else DocumentNode.parent_id.is_(None)
+    ]
+    if cursor:
+        doc_type, name, doc_id = decode_cursor(cursor, 3)
+        try:
+            doc_type = DocumentType(doc_type)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        filters.append(tuple_(*CHILD_ORDER) > tuple_(
+            literal(doc_type, DocumentNode.type.type), literal(name), literal(doc_id)
+        ))
+    
+    statement = select(DocumentNode).where(*filters).order_by(*CHILD_ORDER).limit(limit + 1)
+    page = (await session.exec(statement)).all()
+    has_more = len(page) > limit
+    page = page[:limit]
+    
+    # Nested levels below the folders on this page, ranked per parent to cap fan-out
+    nested = []
+    page_folders = [doc for doc in page if doc.type == DocumentType.FOLDER]
+    if depth > 1 and page_folders:
+        level = parent.depth + 1 if parent else 0
+        rank = func.row_number().over(
+            partition_by=DocumentNode.parent_id,
+            order_by=CHILD_ORDER
+        ).label("rank")
+        ranked = select(DocumentNode.id, rank).where(
+            DocumentNode.claim_id == claim_id,
+            DocumentNode.depth > level,
+            DocumentNode.depth < level + depth,
+            or_(*[DocumentNode.path.startswith(folder.path) for folder in page_folders])
+        ).subquery()
+        nested_statement = (
+            select(DocumentNode)
+            .join(ranked, ranked.c.id == DocumentNode.id)
+            .where(ranked.c.rank <= limit)
+            .order_by(DocumentNode.depth, *CHILD_ORDER)
+        )
+        nested = (await session.exec(nested_statement)).all()
+    
+    # Child counts for every folder we return
+    folder_ids = [doc.id for doc in page_folders] + [
+        doc.id for doc in nested if doc.type == DocumentType.FOLDER
+    ]
+    child_counts = {}
+    if folder_ids:
+        count_statement = select(DocumentNode.parent_id, func.count()).where(
+            DocumentNode.parent_id.in_(folder_ids)
+        ).group_by(DocumentNode.parent_id)
+        child_counts = dict((await session.exec(count_statement)).all())
+    
+    # Assemble; nested rows arrive ordered by depth, so parents precede children
+    doc_map = {}
+    items = []
+    for doc in list(page) + list(nested):
+        doc_dict = document_to_dict(doc)
+        if doc.type == DocumentType.FOLDER:
+            doc_dict["childCount"] = child_counts.get(doc.id, 0)
+        doc_map[doc.id] = doc_dict
+        
+        if doc.parent_id == (parent.id if parent else None):
+            items.append(doc_dict)
+        elif doc.parent_id in doc_map:
+            doc_map[doc.parent_id]["children"].append(doc_dict)
+    
+    next_cursor = None
+    if has_more:
+        last = page[-1]
+        next_cursor = encode_cursor([last.type.value, last.name, last.id])
+    
+    return {
+        "parentId": parent.id if parent else None,
+        "items": items,
+        "nextCursor": next_cursor
+    }
+
 @router.get("/claims/{claim_id}/documents")
 async def get_claim_documents(
     claim_id: str,
+    response: Response,
+    parent_id: Optional[str] = None,
+    depth: Optional[int] = Query(None, ge=1, le=MAX_TREE_DEPTH),
+    limit: int = Query(100, ge=1, le=MAX_TREE_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Get the document/folder tree for a specific claim
+
+    Without ``depth`` the whole tree is returned. With ``depth`` only the
+    children of ``parent_id`` (the claim root by default) are returned, ``limit``
+    at a time with a ``nextCursor`` for the next page, each folder carrying a
+    ``childCount`` and its first ``depth - 1`` levels of children.
+
+    Responses carry the claim's document version as ETag; a matching
+    If-None-Match is answered with 304 before any document is loaded.
     """
     # Verify claim belongs to user
     claim_statement = select(Claim).where(
         Claim.id == claim_id,
         Claim.user_id == current_user.id
     )
-    claim = session.exec(claim_statement).first()
+    claim = (await session.exec(claim_statement)).first()
     
     if not claim:
         raise HTTPException(
@@ -84,20 +590,135 @@ async def get_claim_documents(
             detail="Claim not found"
         )
     
+    # Let clients revalidate cheaply: the tree only changes when the version does
+    tree_headers = {
+        "ETag": f'"{claim.id}-v{claim.document_version}"',
+        "Cache-Control": "private, no-cache"
+    }
+    if etag_matches(if_none_match, tree_headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=tree_headers)
+    response.headers.update(tree_headers)
+    
+    # Lazy mode: one folder level (or a bounded depth) at a time
+    if depth is not None:
+        parent = None
+        if parent_id:
+            parent_statement = select(DocumentNode).where(
+                DocumentNode.id == parent_id,
+                DocumentNode.claim_id == claim_id,
+                DocumentNode.type == DocumentType.FOLDER
+            )
+            parent = (await session.exec(parent_statement)).first()
+            
+            if not parent:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Parent folder not found"
+                )
+        
+        return await load_document_level(session, claim_id, parent, depth, limit, cursor)
+    
     # Get all documents for this claim
     statement = select(DocumentNode).where(DocumentNode.claim_id == claim_id)
-    documents = session.exec(statement).all()
+    documents = (await session.exec(statement)).all()
     
     # Build and return tree structure
     return build_document_tree(documents)
 
+@router.get("/claims/{claim_id}/stats")
+async def get_claim_stats(
+    claim_id: str,
+    folder_id: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Document counts and stored bytes of a claim, or of one folder's subtree
+
+    Read from the counters every document change keeps up to date: a
+    primary-key lookup whatever the size of the tree.
+    """
+    await get_owned_claim(session, claim_id, current_user)
+    
+    if folder_id:
+        folder_statement = select(DocumentNode.id).where(
+            DocumentNode.id == folder_id,
+            DocumentNode.claim_id == claim_id,
+            DocumentNode.type == DocumentType.FOLDER
+        )
+        if not (await session.exec(folder_statement)).first():
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Folder not found"
+            )
+    
+    stats = await get_stats(session, claim_id, folder_id or CLAIM_SCOPE)
+    return {
+        "claimId": claim_id,
+        "folderId": folder_id,
+        "fileCount": stats["file_count"],
+        "folderCount": stats["folder_count"],
+        "totalBytes": stats["total_bytes"],
+        "errorCount": stats["error_count"],
+        "processingCount": stats["processing_count"],
+        "quotaBytes": CLAIM_STORAGE_QUOTA_BYTES or None
+    }
+
+@router.get("/claims/{claim_id}/export")
+async def export_claim_documents(
+    claim_id: str,
+    folder_id: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Download a claim's documents (or one folder's subtree) as a streamed ZIP
+
+    The archive is written as storage objects arrive, with a few files
+    prefetched ahead, so memory use doesn't grow with the export size.
+    """
+    claim = await get_owned_claim(session, claim_id, current_user)
+
+    storage = get_storage()
+
+    folder = None
+    if folder_id:
+        folder_statement = select(DocumentNode).where(
+            DocumentNode.id == folder_id,
+            DocumentNode.claim_id == claim_id,
+            DocumentNode.type == DocumentType.FOLDER
+        )
+        folder = (await session.exec(folder_statement)).first()
+
+        if not folder:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Folder not found"
+            )
+
+    # The tree is loaded up front; storage is read while the response streams
+    target = subtree_filter(folder) if folder else DocumentNode.claim_id == claim_id
+    nodes = (await session.exec(select(DocumentNode).where(target))).all()
+    entries = archive_entries(nodes, folder.id if folder else None)
+
+    archive_name = f"{folder.name if folder else claim.name}.zip"
+    return StreamingResponse(
+        stream_zip(storage, entries),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": content_disposition("attachment", archive_name),
+            "Cache-Control": "private, no-store",
+            "X-Content-Type-Options": "nosniff"
+        }
+    )
+
 @router.post("/folder")
 async def create_folder(
     claim_id: str = Form(...),
     parent_id: Optional[str] = Form(None),
     name: str = Form(...),
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Create a new folder within a claim
@@ -107,7 +728,7 @@ async def create_folder(
         Claim.id == claim_id,
         Claim.user_id == current_user.id
     )
-    claim = session.exec(claim_statement).first()
+    claim = (await session.exec(claim_statement)).first()
     
     if not claim:
         raise HTTPException(
@@ -115,35 +736,29 @@ async def create_folder(
             detail="Claim not found"
         )
     
-    # Verify parent exists if provided
-    if parent_id:
-        parent_statement = select(DocumentNode).where(
-            DocumentNode.id == parent_id,
-            DocumentNode.claim_id == claim_id
-        )
-        parent = session.exec(parent_statement).first()
-        
-        if not parent:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Parent folder not found"
-            )
+    # Verify parent exists if provided, holding its path steady until commit
+    parent = await get_parent_folder(session, claim_id, parent_id, lock=True)
     
     # Create new folder
+    folder_id = f"doc-{uuid.uuid4()}"
     new_folder = DocumentNode(
-        id=f"doc-{uuid.uuid4()}",
+        id=folder_id,
         name=name,
         type=DocumentType.FOLDER,
         claim_id=claim_id,
         parent_id=parent_id,
+        path=node_path(parent, folder_id),
+        depth=parent.depth + 1 if parent else 0,
         status=DocumentStatus.UPLOADED,
         created_at=datetime.utcnow(),
         updated_at=datetime.utcnow()
     )
     
     session.add(new_folder)
-    session.commit()
-    session.refresh(new_folder)
+    await count_new_nodes(session, claim_id, [new_folder])
+    await bump_document_version(session, claim_id)
+    await session.commit()
+    await session.refresh(new_folder)
     
     return {
         "id": new_folder.id,
@@ -159,164 +774,375 @@ async def create_folder(
 
 @router.post("/upload")
 async def upload_file(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     claim_id: str = Form(...),
     parent_id: Optional[str] = Form(None),
+    requirement: Optional[str] = Form(None),
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
-    Handle file uploads
+    Handle file uploads, optionally tagged with the required document they fulfil
     """
-    # Verify claim belongs to user
-    claim_statement = select(Claim).where(
-        Claim.id == claim_id,
-        Claim.user_id == current_user.id
-    )
-    claim = session.exec(claim_statement).first()
+    # Verify claim belongs to user, parent exists and the tag is on the checklist
+    await get_owned_claim(session, claim_id, current_user)
+    await get_parent_folder(session, claim_id, parent_id)
+    await check_requirement(session, claim_id, requirement)
     
-    if not claim:
+    # Reject oversized uploads before touching storage
+    check_upload_size(file.size)
+    digest = StreamDigest()
+    
+    storage = get_storage()
+    content_type = file.content_type or "application/octet-stream"
+    try:
+        # Hash the spooled upload first; identical content is stored once
+        await digest_stream(iter_upload_file(file), digest)
+        await check_claim_quota(session, claim_id, digest.size)
+        # Committed, so nothing stays locked while the bytes upload
+        file_url, written = await reference_blob(session, digest, content_type)
+    except HTTPException:
+        # Re-raise HTTP exceptions
+        raise
+    except Exception as e:
+        print(f"Upload error for {file.filename}: {str(e)}")
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Claim not found"
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="File upload failed"
         )
     
-    # Verify parent exists if provided
-    if parent_id:
-        parent_statement = select(DocumentNode).where(
-            DocumentNode.id == parent_id,
-            DocumentNode.claim_id == claim_id
+    file_type = file_extension_of(file.filename) or 'bin'
+    upload_status = DocumentStatus.UPLOADED  # Successfully uploaded
+    try:
+        if written:
+            try:
+                await write_blob(storage, digest.sha256, digest.size, content_type, lambda: iter_upload_file(file))
+            except Exception as e:
+                print(f"Upload error for {file.filename}: {str(e)}")
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="File upload failed"
+                )
+        
+        # Create new file document under the parent as it is now, held steady until commit
+        parent = await get_parent_folder(session, claim_id, parent_id, lock=True)
+        new_file = new_file_node(claim_id, parent, file.filename, file_url, file_type, digest.size, upload_status, requirement)
+        
+        session.add(new_file)
+        await mark_stored(session, [digest.sha256] if written else [])
+        # Authoritative quota check: the claim's counter row stays locked until commit
+        enforce_claim_quota(await count_new_nodes(session, claim_id, [new_file]))
+        await count_requirement(session, claim_id, requirement, 1)
+        await bump_document_version(session, claim_id)
+        await session.commit()
+    except BaseException:
+        await give_back_blob_refs(session, {digest.sha256: 1})
+        raise
+    await session.refresh(new_file)
+    
+    # Render the grid thumbnail of new content once the response is out
+    if written and has_thumbnail(file_type):
+        background_tasks.add_task(generate_thumbnail_task, storage, file_url)
+    
+    return uploaded_file_response(new_file, digest)
+
+@router.post("/upload/batch")
+async def upload_files_batch(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    claim_id: str = Form(...),
+    parent_id: Optional[str] = Form(None),
+    requirement: Optional[str] = Form(None),
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Upload many files into one folder with a single ownership check and commit
+
+    A ``requirement`` tags every file of the batch with that required document.
+
+    Files are hashed first and referenced with one blob upsert; only content not
+    stored before is written, by at most BATCH_UPLOAD_CONCURRENCY concurrent
+    writers. Files that fail are reported per file and don't abort the rest.
+    """
+    # Verify claim belongs to user, parent exists and the tag is on the checklist, once for all files
+    await get_owned_claim(session, claim_id, current_user)
+    await get_parent_folder(session, claim_id, parent_id)
+    await check_requirement(session, claim_id, requirement)
+    
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BATCH_FILES} files per batch"
         )
-        parent = session.exec(parent_statement).first()
+    
+    storage = get_storage()
+    writers = asyncio.Semaphore(BATCH_UPLOAD_CONCURRENCY)
+    
+    async def hash_file(file: UploadFile):
+        """Digest one spooled file; returns its digest or raises"""
+        check_upload_size(file.size)
+        return await digest_stream(iter_upload_file(file), StreamDigest())
+    
+    # Per file: a digest or the exception that failed it
+    outcomes = await asyncio.gather(*(hash_file(file) for file in files), return_exceptions=True)
+    hashed = [
+        index for index, outcome in enumerate(outcomes)
+        if not isinstance(outcome, BaseException)
+    ]
+    
+    # The batch is accepted or refused as a whole against the claim's quota
+    await check_claim_quota(session, claim_id, sum(outcomes[index].size for index in hashed))
+    
+    # One upsert takes a reference for every file, committed so nothing stays
+    # locked while the bytes upload; content not stored yet gets one writer
+    references = {}
+    new_blobs = {}
+    if hashed:
+        stored_flags = await acquire_blobs(session, [
+            {
+                "sha256": outcomes[index].sha256,
+                "size": outcomes[index].size,
+                "content_type": files[index].content_type or "application/octet-stream"
+            }
+            for index in hashed
+        ])
+        await session.commit()
+        for index in hashed:
+            sha256 = outcomes[index].sha256
+            references[sha256] = references.get(sha256, 0) + 1
+            if not stored_flags[sha256]:
+                new_blobs.setdefault(sha256, index)
+    
+    async def write(index: int):
+        file, digest = files[index], outcomes[index]
+        async with writers:
+            await write_blob(
+                storage, digest.sha256, digest.size,
+                file.content_type or "application/octet-stream",
+                lambda: iter_upload_file(file)
+            )
+    
+    orphaned = []
+    try:
+        written = await asyncio.gather(*(write(index) for index in new_blobs.values()), return_exceptions=True)
+        write_errors = {
+            sha256: error for sha256, error in zip(new_blobs, written) if isinstance(error, BaseException)
+        }
         
-        if not parent:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Parent folder not found"
+        # Files whose content failed to store fail too, and give their references back
+        released = {}
+        for index in hashed:
+            sha256 = outcomes[index].sha256
+            if sha256 in write_errors:
+                outcomes[index] = write_errors[sha256]
+                released[sha256] = released.get(sha256, 0) + 1
+        if released:
+            orphaned = blob_object_paths(await release_blob_refs(session, released))
+            await enqueue_deletes(session, orphaned)
+        
+        # The parent as it is now, held steady until commit
+        parent = await get_parent_folder(session, claim_id, parent_id, lock=True)
+        nodes = {}
+        for index, (file, outcome) in enumerate(zip(files, outcomes)):
+            if isinstance(outcome, BaseException):
+                continue
+            file_type = file_extension_of(file.filename) or 'bin'
+            nodes[index] = new_file_node(
+                claim_id, parent, file.filename, blob_path(outcome.sha256), file_type, outcome.size,
+                DocumentStatus.UPLOADED, requirement
             )
+        
+        await mark_stored(session, [sha256 for sha256 in new_blobs if sha256 not in write_errors])
+        # One multi-row INSERT for every file that made it into storage
+        if nodes:
+            await session.execute(insert(DocumentNode), [node.model_dump() for node in nodes.values()])
+            enforce_claim_quota(await count_new_nodes(session, claim_id, list(nodes.values())))
+            await count_requirement(session, claim_id, requirement, len(nodes))
+            await bump_document_version(session, claim_id)
+        await session.commit()
+    except BaseException:
+        await give_back_blob_refs(session, references)
+        raise
+    if orphaned:
+        storage_cleanup.wake()
+    
+    # Render grid thumbnails of newly stored content once the response is out
+    for sha256, index in new_blobs.items():
+        if sha256 not in write_errors and has_thumbnail(file_extension_of(files[index].filename)):
+            background_tasks.add_task(generate_thumbnail_task, storage, blob_path(sha256))
+    
+    results = []
+    for index, (file, outcome) in enumerate(zip(files, outcomes)):
+        if isinstance(outcome, HTTPException):
+            results.append({"filename": file.filename, "success": False, "error": outcome.detail})
+        elif isinstance(outcome, BaseException):
+            print(f"Upload error for {file.filename}: {str(outcome)}")
+            results.append({"filename": file.filename, "success": False, "error": "File upload failed"})
+        else:
+            results.append({
+                "filename": file.filename,
+                "success": True,
+                "document": uploaded_file_response(nodes[index], outcome)
+            })
+    
+    return {
+        "uploaded": len(nodes),
+        "failed": len(files) - len(nodes),
+        "results": results
+    }
+
+@router.post("/uploads")
+async def create_upload_session(
+    upload: ResumableUploadCreate,
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Start a resumable upload; the file is then sent as numbered chunks
+    """
+    await get_owned_claim(session, upload.claim_id, current_user)
+    await get_parent_folder(session, upload.claim_id, upload.parent_id)
+    check_upload_size(upload.size)
+    await check_claim_quota(session, upload.claim_id, upload.size)
+    await check_requirement(session, upload.claim_id, upload.requirement)
+    
+    manifest = upload_sessions.create(
+        user_id=current_user.id,
+        claim_id=upload.claim_id,
+        parent_id=upload.parent_id,
+        filename=upload.filename,
+        content_type=upload.content_type or "application/octet-stream",
+        size=upload.size,
+        requirement=upload.requirement
+    )
+    return upload_sessions.describe(manifest)
+
+@router.get("/uploads/{upload_id}")
+async def get_upload_session(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Report which chunks of a resumable upload have arrived and the resume offset
+    """
+    manifest = upload_sessions.load(upload_id, current_user.id)
+    return upload_sessions.describe(manifest)
+
+@router.put("/uploads/{upload_id}/chunks/{index}")
+async def put_upload_chunk(
+    upload_id: str,
+    index: int,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Receive one chunk as the raw request body; re-sending a chunk replaces it
+    """
+    manifest = upload_sessions.load(upload_id, current_user.id)
+    await upload_sessions.write_chunk(manifest, index, request.stream())
+    return upload_sessions.describe(manifest)
+
+@router.post("/uploads/{upload_id}/finalize")
+async def finalize_upload_session(
+    upload_id: str,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Stream the staged chunks into storage and create the file's DocumentNode
+    """
+    manifest = upload_sessions.load(upload_id, current_user.id)
+    upload_status = upload_sessions.describe(manifest)
+    if not upload_status["complete"]:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload incomplete: resume at offset {upload_status['offset']}"
+        )
     
-    # Upload to Supabase Storage if configured
-    supabase = get_supabase_client()
-    if supabase:
+    # Claim the session so a concurrent or retried finalize, or an abort,
+    # cannot store it twice or delete chunks while they are read
+    with upload_sessions.claimed(manifest):
+        # The claim or folder may have gone away while chunks were arriving
+        claim_id = manifest["claim_id"]
+        await get_owned_claim(session, claim_id, current_user)
+        await get_parent_folder(session, claim_id, manifest["parent_id"])
+    
+        storage = get_storage()
+        digest = StreamDigest()
         try:
-            # Read file content
-            file_content = await file.read()
-            file.file.seek(0)  # Reset file pointer for potential re-use
-            
-            # Build the full path including parent folder hierarchy
-            def build_folder_path(parent_id: str, session: Session) -> str:
-                """Recursively build the folder path from root to parent"""
-                if not parent_id:
-                    return ""
-                
-                parent_statement = select(DocumentNode).where(DocumentNode.id == parent_id)
-                parent = session.exec(parent_statement).first()
-                
-                if not parent:
-                    return ""
-                
-                # Recursively get parent path
-                parent_path = build_folder_path(parent.parent_id, session) if parent.parent_id else ""
-                
-                # Combine with current folder name (sanitize for file system)
-                folder_name = parent.name.replace("/", "_").replace("\\", "_")
-                
-                if parent_path:
-                    return f"{parent_path}/{folder_name}"
-                else:
-                    return folder_name
-            
-            # Generate file path with proper folder hierarchy
-            file_extension = file.filename.split('.')[-1].lower() if '.' in file.filename else 'bin'
-            folder_path = build_folder_path(parent_id, session) if parent_id else ""
-            unique_filename = f"{uuid.uuid4()}.{file_extension}"
-            
-            # Combine claim_id, folder path, and filename
-            if folder_path:
-                full_path = f"{claim_id}/{folder_path}/{unique_filename}"
-            else:
-                full_path = f"{claim_id}/{unique_filename}"
-            
-            print(f"📁 Uploading file to Supabase path: {full_path}")
-            
-            # Upload to Supabase Storage
-            result = supabase.storage.from_("documents").upload(
-                full_path, 
-                file_content,
-                file_options={"content-type": file.content_type or "application/octet-stream"}
-            )
-            
-            if hasattr(result, 'error') and result.error:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Failed to upload file: {result.error.message}"
-                )
-            file_url = full_path  # Store the full path for later retrieval
-            file_type = file_extension
-            upload_status = DocumentStatus.UPLOADED  # Successfully uploaded
-            
+            # Hash the staged chunks first; identical content is stored once
+            await digest_stream(upload_sessions.iter_assembled(manifest, UPLOAD_CHUNK_SIZE), digest)
+            await check_claim_quota(session, claim_id, digest.size)
+            # Committed, so nothing stays locked while the bytes upload
+            full_path, written = await reference_blob(session, digest, manifest["content_type"])
         except HTTPException:
-            # Re-raise HTTP exceptions
             raise
         except Exception as e:
+            print(f"Upload error for {manifest['filename']}: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="File upload failed"
             )
-    else:
-        # Debug why Supabase is not available
-        supabase_url = os.getenv("SUPABASE_URL")
-        supabase_anon_key = os.getenv("SUPABASE_ANON_KEY")
-        supabase_service_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-        
-        print(f"Supabase not available during upload:")
-        print(f"SUPABASE_URL: {'✓' if supabase_url else '✗'}")
-        print(f"SUPABASE_ANON_KEY: {'✓' if supabase_anon_key else '✗'}")
-        print(f"SUPABASE_SERVICE_ROLE_KEY: {'✓' if supabase_service_key else '✗'}")
-        
-        # Fallback to demo mode
-        file_url = f"/demo/{file.filename}"
-        file_type = file.filename.split('.')[-1].lower() if '.' in file.filename else None
-        upload_status = DocumentStatus.PROCESSING  # Demo mode
-    
-    # Create new file document
-    new_file = DocumentNode(
-        id=f"doc-{uuid.uuid4()}",
-        name=file.filename,
-        type=DocumentType.FILE,
-        claim_id=claim_id,
-        parent_id=parent_id,
-        status=upload_status,  # Use appropriate status
-        file_url=file_url,
-        file_type=file_type,
-        created_at=datetime.utcnow(),
-        updated_at=datetime.utcnow()
-    )
     
-    session.add(new_file)
-    session.commit()
-    session.refresh(new_file)
+        try:
+            if written:
+                try:
+                    await write_blob(
+                        storage, digest.sha256, digest.size, manifest["content_type"],
+                        lambda: upload_sessions.iter_assembled(manifest, UPLOAD_CHUNK_SIZE)
+                    )
+                except Exception as e:
+                    print(f"Upload error for {manifest['filename']}: {str(e)}")
+                    raise HTTPException(
+                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                        detail="File upload failed"
+                    )
+    
+            parent = await get_parent_folder(session, claim_id, manifest["parent_id"], lock=True)
+            new_file = new_file_node(
+                claim_id, parent, manifest["filename"], full_path,
+                file_extension_of(manifest["filename"]) or 'bin', digest.size, DocumentStatus.UPLOADED,
+                manifest.get("requirement")
+            )
+            session.add(new_file)
+            await mark_stored(session, [digest.sha256] if written else [])
+            enforce_claim_quota(await count_new_nodes(session, claim_id, [new_file]))
+            await count_requirement(session, claim_id, new_file.requirement, 1)
+            await bump_document_version(session, claim_id)
+            await session.commit()
+        except BaseException:
+            await give_back_blob_refs(session, {digest.sha256: 1})
+            raise
     
-    return {
-        "id": new_file.id,
-        "name": new_file.name,
-        "type": new_file.type,
-        "claimId": new_file.claim_id,
-        "parentId": new_file.parent_id,
-        "status": new_file.status,
-        "fileUrl": new_file.file_url,
-        "fileType": new_file.file_type,
-        "createdAt": new_file.created_at.isoformat(),
-        "updatedAt": new_file.updated_at.isoformat(),
-        "children": []
-    }
+    # Committed: the session is spent even if anything below fails
+    upload_sessions.discard(upload_id)
+    await session.refresh(new_file)
+    if written and has_thumbnail(new_file.file_type):
+        background_tasks.add_task(generate_thumbnail_task, storage, full_path)
+    return uploaded_file_response(new_file, digest)
+
+@router.delete("/uploads/{upload_id}")
+async def abort_upload_session(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Abandon a resumable upload and drop its staged chunks
+    """
+    manifest = upload_sessions.load(upload_id, current_user.id)
+    with upload_sessions.claimed(manifest):
+        upload_sessions.discard(upload_id)
+    return {"message": "Upload session aborted"}
 
 @router.patch("/{document_id}", response_model=dict)
 async def rename_document(
     document_id: str,
     update_data: DocumentNodeUpdate,
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Rename a file or folder
@@ -326,7 +1152,7 @@ async def rename_document(
         DocumentNode.id == document_id,
         Claim.user_id == current_user.id
     )
-    document = session.exec(statement).first()
+    document = (await session.exec(statement)).first()
     
     if not document:
         raise HTTPException(
@@ -336,14 +1162,42 @@ async def rename_document(
     
     # Update fields
     update_fields = update_data.dict(exclude_unset=True)
+    document = await lock_document(session, document, subtree="parent_id" in update_fields)
+    
+    # Re-parenting has to go through the path index
+    if "parent_id" in update_fields:
+        new_parent_id = update_fields.pop("parent_id")
+        if new_parent_id != document.parent_id:
+            new_parent = await get_target_folder(session, document, new_parent_id)
+            await move_document_stats(session, document, new_parent)
+    
+    # Tagging moves the file from one checklist item to another
+    if "requirement" in update_fields:
+        requirement = update_fields.pop("requirement")
+        if requirement != document.requirement:
+            if document.type != DocumentType.FILE:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Only files can fulfil a required document"
+                )
+            await check_requirement(session, document.claim_id, requirement)
+            await count_requirement(session, document.claim_id, document.requirement, -1)
+            await count_requirement(session, document.claim_id, requirement, 1)
+            document.requirement = requirement
+    
+    # Status changes move the file between the error/processing counters
+    counted_before = node_delta(document)
     for field, value in update_fields.items():
         setattr(document, field, value)
+    status_delta = {field: value - counted_before[field] for field, value in node_delta(document).items()}
+    await apply_stats_deltas(session, document.claim_id, add_delta({}, stats_scopes(document.path), status_delta))
     
     document.updated_at = datetime.utcnow()
     
     session.add(document)
-    session.commit()
-    session.refresh(document)
+    await bump_document_version(session, document.claim_id)
+    await session.commit()
+    await session.refresh(document)
     
     return {
         "id": document.id,
@@ -357,14 +1211,15 @@ async def rename_document(
         "createdAt": document.created_at.isoformat(),
         "updatedAt": document.updated_at.isoformat(),
         "statusMessage": document.status_message,
-        "statusIcon": document.status_icon
+        "statusIcon": document.status_icon,
+        "thumbnailUrl": thumbnail_url(document)
     }
 
 @router.delete("/{document_id}")
 async def delete_document(
     document_id: str,
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Delete a file or folder (and its children if it's a folder)
@@ -374,7 +1229,7 @@ async def delete_document(
         DocumentNode.id == document_id,
         Claim.user_id == current_user.id
     )
-    document = session.exec(statement).first()
+    document = (await session.exec(statement)).first()
     
     if not document:
         raise HTTPException(
@@ -382,47 +1237,39 @@ async def delete_document(
             detail="Document not found"
         )
     
-    # Find all children recursively (for folder deletion)
-    def get_all_children(parent_id: str) -> List[DocumentNode]:
-        children_statement = select(DocumentNode).where(
-            DocumentNode.parent_id == parent_id
-        )
-        children = session.exec(children_statement).all()
-        
-        all_children = list(children)
-        for child in children:
-            if child.type == DocumentType.FOLDER:
-                all_children.extend(get_all_children(child.id))
-        
-        return all_children
-    
-    # Get all documents to delete
-    to_delete = [document]
+    # The document and, for folders, its whole subtree, matched by one indexed filter
+    document = await lock_document(session, document, subtree=True)
     if document.type == DocumentType.FOLDER:
-        to_delete.extend(get_all_children(document.id))
-    
-    # Delete files from Supabase Storage first
-    supabase = get_supabase_client()
-    if supabase:
-        files_to_delete = []
-        for doc in to_delete:
-            if doc.type == DocumentType.FILE and doc.file_url and not doc.file_url.startswith("/demo/"):
-                files_to_delete.append(doc.file_url)
-        
-        if files_to_delete:
-            try:
-                # Delete files from Supabase Storage
-                result = supabase.storage.from_("documents").remove(files_to_delete)
-                print(f"🗑️ Deleted {len(files_to_delete)} files from Supabase Storage")
-            except Exception as e:
-                print(f"⚠️ Warning: Failed to delete some files from Supabase Storage: {str(e)}")
-                # Continue with database deletion even if storage deletion fails
+        target = subtree_filter(document)
+    else:
+        target = DocumentNode.id == document.id
+    
+    # Files stored before deduplication have objects of their own
+    files_to_delete = await legacy_file_paths(session, target)
     
-    # Delete all documents from database
-    for doc in to_delete:
-        session.delete(doc)
+    # Shared blobs only go away with their last reference
+    released = await release_document_blobs(session, target)
     
-    session.commit()
+    # Tagged files no longer fulfil their required documents
+    await release_requirements(session, target)
+    
+    # Take the subtree out of its ancestors' totals and drop its folders' own rows
+    removed = await subtree_totals(session, target)
+    await apply_stats_deltas(
+        session, document.claim_id,
+        add_delta({}, stats_scopes(document.path), scaled(removed, -1))
+    )
+    await drop_folder_stats(session, document.claim_id, target)
+    
+    # One DELETE for the whole subtree (parent links are checked at statement end)
+    await session.execute(delete(DocumentNode).where(target))
+    
+    await bump_document_version(session, document.claim_id)
+    
+    # Storage objects go in the same transaction, removed by the cleanup worker after commit
+    await enqueue_deletes(session, files_to_delete + blob_object_paths(released))
+    await session.commit()
+    storage_cleanup.wake()
     
     return {"message": "Document and associated files deleted successfully"}
 
@@ -431,7 +1278,7 @@ async def move_document(
     document_id: str,
     new_parent_id: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Move a file or folder to a new parent directory
@@ -441,7 +1288,7 @@ async def move_document(
         DocumentNode.id == document_id,
         Claim.user_id == current_user.id
     )
-    document = session.exec(statement).first()
+    document = (await session.exec(statement)).first()
     
     if not document:
         raise HTTPException(
@@ -449,33 +1296,16 @@ async def move_document(
             detail="Document not found"
         )
     
-    # Verify new parent exists and belongs to same claim if provided
-    if new_parent_id:
-        parent_statement = select(DocumentNode).where(
-            DocumentNode.id == new_parent_id,
-            DocumentNode.claim_id == document.claim_id
-        )
-        parent = session.exec(parent_statement).first()
-        
-        if not parent:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="New parent folder not found"
-            )
-        
-        if parent.type != DocumentType.FOLDER:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Parent must be a folder"
-            )
-    
-    # Update parent_id
-    document.parent_id = new_parent_id
+    # Verify new parent exists, belongs to same claim and is not inside the document
+    document = await lock_document(session, document, subtree=True)
+    new_parent = await get_target_folder(session, document, new_parent_id)
+    await move_document_stats(session, document, new_parent)
     document.updated_at = datetime.utcnow()
     
     session.add(document)
-    session.commit()
-    session.refresh(document)
+    await bump_document_version(session, document.claim_id)
+    await session.commit()
+    await session.refresh(document)
     
     return {
         "id": document.id,
@@ -489,50 +1319,210 @@ async def move_document(
         "createdAt": document.created_at.isoformat(),
         "updatedAt": document.updated_at.isoformat(),
         "statusMessage": document.status_message,
-        "statusIcon": document.status_icon
+        "statusIcon": document.status_icon,
+        "thumbnailUrl": thumbnail_url(document)
     }
 
-@router.get("/{document_id}/download")
-async def download_file(
+# Media types served for stored files, by extension
+MEDIA_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg", 
+    "jpeg": "image/jpeg",
+    "gif": "image/gif",
+    "bmp": "image/bmp",
+    "webp": "image/webp",
+    "pdf": "application/pdf",
+    "txt": "text/plain",
+    "csv": "text/plain",
+    "json": "application/json"
+}
+
+def media_type_for(document: DocumentNode) -> str:
+    file_extension = document.file_type or (document.name.split(".")[-1].lower() if "." in document.name else "")
+    return MEDIA_TYPES.get(file_extension, "application/octet-stream")
+
+def parse_range_header(range_header: Optional[str]) -> Optional[ByteRange]:
+    """
+    Parse a single-range "bytes=first-last" header; anything else means the full body
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    
+    first, _, last = range_header[len("bytes="):].strip().partition("-")
+    try:
+        byte_range = (int(first) if first else None, int(last) if last else None)
+    except ValueError:
+        return None
+    
+    if byte_range == (None, None) or (None not in byte_range and byte_range[1] < byte_range[0]):
+        return None
+    return byte_range
+
+async def stream_object(
+    storage: StorageBackend,
+    file_url: str,
+    updated_at: Optional[datetime],
+    media_type: str,
+    byte_range: Optional[ByteRange],
+    headers: dict
+) -> Response:
+    """
+    Response streaming a stored object, honoring a byte range
+
+    Remote objects are served from the local blob cache when possible (given
+    ``updated_at``); a full (non-range) miss fills the cache first, once for all
+    concurrent requests. Anything else is read through ``open_read_shared``,
+    so concurrent identical reads share a fetch there too. Raises
+    ObjectNotFound / RangeNotSatisfiable.
+    """
+    stored = None
+    cached_path = None
+    if updated_at is not None and blob_cache.enabled and not storage.is_local:
+        cache_key = blob_cache.cache_key(file_url, updated_at)
+        if byte_range is None:
+            cached_path, stored = await blob_cache.fetch(storage, cache_key, file_url)
+        else:
+            cached_path = blob_cache.lookup(cache_key)
+    
+    if cached_path:
+        try:
+            # Served from a memory map, like the local storage backend
+            stored = open_file(cached_path, byte_range)
+        except FileNotFoundError:
+            # Evicted since the lookup; read through to storage instead
+            stored = None
+    if stored is None:
+        stored = await open_read_shared(storage, file_url, byte_range)
+    
+    headers = {**headers, "Accept-Ranges": "bytes"}
+    if stored.content_length is not None:
+        # Otherwise the body goes out chunked rather than with a wrong length
+        headers["Content-Length"] = str(stored.content_length)
+    if stored.partial:
+        headers["Content-Range"] = f"bytes {stored.start}-{stored.end}/{stored.size}"
+    
+    return StreamingResponse(
+        stored.chunks,
+        status_code=status.HTTP_206_PARTIAL_CONTENT if stored.partial else status.HTTP_200_OK,
+        media_type=media_type,
+        headers=headers
+    )
+
+async def stream_stored_file(
+    storage: StorageBackend,
+    file_url: str,
+    updated_at: Optional[datetime],
+    media_type: str,
+    range_header: Optional[str],
+    headers: dict
+) -> Response:
+    """
+    Pass a stored file through to the client chunk by chunk, honoring Range
+    """
+    try:
+        return await stream_object(
+            storage, file_url, updated_at, media_type, parse_range_header(range_header), headers
+        )
+    except RangeNotSatisfiable as e:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{e.size if e.size is not None else '*'}"}
+        )
+    except ObjectNotFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File data not found in storage"
+        )
+
+async def stream_document(
+    storage: StorageBackend,
+    document: DocumentNode,
+    range_header: Optional[str],
+    headers: dict
+) -> Response:
+    return await stream_stored_file(
+        storage, document.file_url, document.updated_at, media_type_for(document), range_header, headers
+    )
+
+async def signed_document_url(
+    storage: StorageBackend,
     document_id: str,
-    current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    file_url: str,
+    updated_at: datetime,
+    media_type: str,
+    download_name: Optional[str] = None
 ):
     """
-    Download a file by document ID
+    Signed storage URL for a document, cached per (document, updated_at, disposition)
     """
-    # Get document and verify ownership through claim
-    statement = select(DocumentNode).join(Claim).where(
-        DocumentNode.id == document_id,
-        Claim.user_id == current_user.id,
-        DocumentNode.type == DocumentType.FILE
-    )
-    document = session.exec(statement).first()
-    
-    if not document:
+    cache_key = (document_id, updated_at.isoformat(), download_name is not None)
+    try:
+        return await get_signed_url(storage, file_url, cache_key, download_name, media_type)
+    except ObjectNotFound:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="File not found"
+            detail="File data not found in storage"
         )
-    
-    # Check if Supabase is configured
-    supabase = get_supabase_client()
-    if not supabase:
-        # Debug Supabase configuration
-        supabase_url = os.getenv("SUPABASE_URL")
-        supabase_anon_key = os.getenv("SUPABASE_ANON_KEY")
-        supabase_service_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-        
-        print(f"Supabase configuration debug:")
-        print(f"SUPABASE_URL: {'✓' if supabase_url else '✗'}")
-        print(f"SUPABASE_ANON_KEY: {'✓' if supabase_anon_key else '✗'}")
-        print(f"SUPABASE_SERVICE_ROLE_KEY: {'✓' if supabase_service_key else '✗'}")
-        
+
+def content_disposition(disposition: str, filename: Optional[str] = None) -> str:
+    """
+    Content-Disposition value safe for any file name (RFC 6266 filename*)
+    """
+    if filename is None:
+        return disposition
+    return f"{disposition}; filename*=UTF-8''{quote(filename)}"
+
+@router.get("/signed/{path:path}")
+async def get_signed_object(
+    path: str,
+    expires: int,
+    signature: str,
+    download: Optional[str] = None,
+    content_type: Optional[str] = Query(None, alias="type"),
+    range_header: Optional[str] = Header(None, alias="Range")
+):
+    """
+    Serve a local-storage object from a signed URL; the signature stands in for auth
+
+    Only used with the local backend; Supabase serves its signed URLs itself.
+    """
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage) or not storage.verify(path, expires, signature, download, content_type):
         raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="File storage service not configured - check environment variables"
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid or expired signature"
         )
     
+    signed_headers = {
+        "Content-Disposition": content_disposition("attachment" if download is not None else "inline", download),
+        "Cache-Control": f"private, max-age={max(0, expires - int(time.time()))}",
+        "X-Content-Type-Options": "nosniff"
+    }
+    return await stream_stored_file(
+        storage, path, None, content_type or "application/octet-stream", range_header, signed_headers
+    )
+
+@router.get("/{document_id}/download")
+async def download_file(
+    document_id: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Download a file by document ID, streamed from storage (Range supported)
+
+    Revalidation (If-None-Match / If-Modified-Since) is answered with 304
+    from the document row without reading storage.
+    """
+    # Get document and verify ownership through claim
+    document = await get_owned_file(session, document_id, current_user)
+    
+    storage = get_storage()
+    
     # Check if file_url exists
     if not document.file_url:
         raise HTTPException(
@@ -540,65 +1530,36 @@ async def download_file(
             detail="File path not found in database"
         )
     
-    # For demo files, return error
+    # Placeholders left by the old demo mode have no stored bytes
     if document.file_url.startswith("/demo/"):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Demo file not found - please upload a real file"
         )
     
-    try:
-        # Download from Supabase Storage
-        result = supabase.storage.from_("documents").download(document.file_url)
-        
-        # Handle different response formats from Supabase library
-        if hasattr(result, 'error') and result.error:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to download file from storage: {result.error}"
-            )
-        
-        # Get the actual file data - newer Supabase library returns bytes directly
-        file_data = result if isinstance(result, bytes) else (result.data if hasattr(result, 'data') else result)
-        
-        if not file_data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="File data not found in storage"
-            )
-        
-        # Get file extension for media type (optimized)
-        file_extension = document.file_type or (document.name.split(".")[-1].lower() if "." in document.name else "")
-        
-        # Determine media type (optimized with dict lookup)
-        media_type_map = {
-            "png": "image/png",
-            "jpg": "image/jpeg", 
-            "jpeg": "image/jpeg",
-            "gif": "image/gif",
-            "bmp": "image/bmp",
-            "webp": "image/webp",
-            "pdf": "application/pdf",
-            "txt": "text/plain",
-            "csv": "text/plain",
-            "json": "application/json"
-        }
-        media_type = media_type_map.get(file_extension, "application/octet-stream")
-        
-        # Add cache headers for better performance
-        cache_headers = {
-            "Content-Disposition": f"attachment; filename={document.name}",
-            "Cache-Control": "public, max-age=3600",  # Cache for 1 hour
-            "ETag": f'"{document.id}-{int(document.updated_at.timestamp())}"'  # Simple ETag
-        }
-        
-        # Return the actual file data from Supabase
-        return StreamingResponse(
-            io.BytesIO(file_data),
-            media_type=media_type,
-            headers=cache_headers
+    # Add cache headers for better performance
+    validators = file_validators(document)
+    cache_headers = {
+        "Cache-Control": "public, max-age=3600",  # Cache for 1 hour
+        **validators
+    }
+    if not_modified(if_none_match, if_modified_since, validators["ETag"], document.updated_at):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+    
+    # Signed-URL mode: let the client fetch the bytes from storage directly.
+    # The redirect carries the validators so the next request can revalidate
+    if signed_urls_enabled(storage):
+        signed_url, _ = await signed_document_url(
+            storage, document.id, document.file_url, document.updated_at,
+            media_type_for(document), download_name=document.name
         )
-        
+        return RedirectResponse(
+            signed_url, status_code=status.HTTP_307_TEMPORARY_REDIRECT, headers=validators
+        )
+    cache_headers["Content-Disposition"] = content_disposition("attachment", document.name)
+    
+    try:
+        return await stream_document(storage, document, range_header, cache_headers)
     except HTTPException:
         # Re-raise HTTP exceptions
         raise
@@ -613,113 +1574,136 @@ async def download_file(
 @router.get("/{document_id}/preview")
 async def preview_file(
     document_id: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Fast preview endpoint that streams file directly for inline viewing
+
+    Revalidation is answered with 304 without reading storage.
     """
     # Get document and verify ownership through claim
-    statement = select(DocumentNode).join(Claim).where(
-        DocumentNode.id == document_id,
-        Claim.user_id == current_user.id,
-        DocumentNode.type == DocumentType.FILE
-    )
-    document = session.exec(statement).first()
-    
-    if not document:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="File not found"
-        )
+    document = await get_owned_file(session, document_id, current_user)
     
-    # Check if Supabase is configured
-    supabase = get_supabase_client()
-    if not supabase or not document.file_url or document.file_url.startswith("/demo/"):
+    storage = get_storage()
+    if not document.file_url or document.file_url.startswith("/demo/"):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="File not available for preview"
         )
     
+    # Optimized headers for preview (inline display + caching)
+    validators = file_validators(document)
+    preview_headers = {
+        "Cache-Control": "public, max-age=7200",  # Cache for 2 hours (longer for previews)
+        **validators
+    }
+    if not_modified(if_none_match, if_modified_since, validators["ETag"], document.updated_at):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=preview_headers)
+    preview_headers["Content-Disposition"] = "inline"  # Display inline for preview
+    preview_headers["X-Content-Type-Options"] = "nosniff"
+    
     try:
-        # Download from Supabase Storage
-        result = supabase.storage.from_("documents").download(document.file_url)
-        
-        if hasattr(result, 'error') and result.error:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to load preview"
-            )
-        
-        file_data = result if isinstance(result, bytes) else (result.data if hasattr(result, 'data') else result)
-        
-        if not file_data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="File data not found"
-            )
-        
-        # Get media type for preview
-        file_extension = document.file_type or (document.name.split(".")[-1].lower() if "." in document.name else "")
-        media_type_map = {
-            "png": "image/png",
-            "jpg": "image/jpeg", 
-            "jpeg": "image/jpeg",
-            "gif": "image/gif",
-            "bmp": "image/bmp",
-            "webp": "image/webp",
-            "pdf": "application/pdf"
-        }
-        media_type = media_type_map.get(file_extension, "application/octet-stream")
-        
-        # Optimized headers for preview (inline display + caching)
-        preview_headers = {
-            "Content-Disposition": "inline",  # Display inline for preview
-            "Cache-Control": "public, max-age=7200",  # Cache for 2 hours (longer for previews)
-            "ETag": f'"{document.id}-{int(document.updated_at.timestamp())}"',
-            "X-Content-Type-Options": "nosniff"
-        }
-        
-        return StreamingResponse(
-            io.BytesIO(file_data),
-            media_type=media_type,
-            headers=preview_headers
-        )
-        
+        return await stream_document(storage, document, range_header, preview_headers)
     except HTTPException:
         raise
     except Exception as e:
+        print(f"Preview error for {document_id}: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Preview failed"
         )
 
+@router.get("/{document_id}/thumbnail")
+async def get_thumbnail(
+    document_id: str,
+    v: Optional[str] = Query(None),
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Small WebP rendition of an image file for grid views, rendered on first request if needed
+
+    Fetched through the document's ``thumbnailUrl``, whose ``v`` names the
+    current version, the response may be cached for good; any other URL
+    revalidates on every use.
+    """
+    document = await get_owned_file(session, document_id, current_user)
+    
+    storage = get_storage()
+    if (
+        not has_thumbnail(document.file_type)
+        or not document.file_url or document.file_url.startswith("/demo/")
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Thumbnail not available"
+        )
+    
+    version = thumbnail_version(document)
+    thumbnail_headers = {
+        "Cache-Control": "private, max-age=31536000, immutable" if v == version else "private, no-cache",
+        "ETag": f'"{document.id}-{version}-thumb"',
+        "X-Content-Type-Options": "nosniff"
+    }
+    if etag_matches(if_none_match, thumbnail_headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=thumbnail_headers)
+    
+    try:
+        return await stream_object(
+            storage, thumbnail_path(document.file_url), document.updated_at,
+            THUMBNAIL_MEDIA_TYPE, None, thumbnail_headers
+        )
+    except ObjectNotFound:
+        pass
+    
+    # Not rendered yet (or the upload-time render failed): render it now
+    try:
+        thumbnail = await generate_thumbnail(storage, document.file_url)
+    except ObjectNotFound:
+        thumbnail = None
+    
+    if thumbnail is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Thumbnail not available"
+        )
+    return Response(thumbnail, media_type=THUMBNAIL_MEDIA_TYPE, headers=thumbnail_headers)
+
 @router.get("/{document_id}/preview-url")
 async def get_preview_url(
     document_id: str,
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
-    Get a preview URL for a document - now points to optimized preview endpoint
+    Get a preview URL for a document
+
+    In signed-URL mode this is a short-lived storage URL the client can load
+    directly; otherwise it points at the authenticated preview endpoint.
     """
     # Simple validation without heavy database query
-    statement = select(DocumentNode.id, DocumentNode.file_url).join(Claim).where(
-        DocumentNode.id == document_id,
-        Claim.user_id == current_user.id,
-        DocumentNode.type == DocumentType.FILE
-    )
-    document = session.exec(statement).first()
+    document = await get_owned_file(session, document_id, current_user)
     
-    if not document:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="File not found"
+    storage = get_storage()
+    if signed_urls_enabled(storage) and document.file_url and not document.file_url.startswith("/demo/"):
+        signed_url, expires_at = await signed_document_url(
+            storage, document.id, document.file_url, document.updated_at, media_type_for(document)
         )
+        return {
+            "url": signed_url,
+            "requires_auth": False,
+            "headers": {},
+            "expires_at": datetime.utcfromtimestamp(expires_at).isoformat()
+        }
     
     # Return optimized preview endpoint
     return {
         "url": f"/api/documents/{document_id}/preview",
         "requires_auth": True,
         "headers": {}
-    }
\ No newline at end of file
+    }
@@ -1,10 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import List
 from datetime import datetime
 
 from models import Notification, NotificationCreate, NotificationUpdate, User
-from database import get_session
+from database import get_async_session
 from auth_utils import get_current_user
 
 router = APIRouter(
@@ -16,7 +17,7 @@ router = APIRouter(
 @router.get("/", response_model=List[Notification])
 async def get_notifications(
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Get all notifications for the authenticated user, sorted by creation date
@@ -25,14 +26,14 @@ async def get_notifications(
         Notification.user_id == current_user.id
     ).order_by(Notification.created_at.desc())
     
-    notifications = session.exec(statement).all()
+    notifications = (await session.exec(statement)).all()
     return notifications
 
 @router.patch("/{notification_id}/read", response_model=Notification)
 async def mark_notification_as_read(
     notification_id: str,
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Mark a specific notification as read
@@ -41,7 +42,7 @@ async def mark_notification_as_read(
         Notification.id == notification_id,
         Notification.user_id == current_user.id
     )
-    notification = session.exec(statement).first()
+    notification = (await session.exec(statement)).first()
     
     if not notification:
         raise HTTPException(
@@ -51,15 +52,15 @@ async def mark_notification_as_read(
     
     notification.is_read = True
     session.add(notification)
-    session.commit()
-    session.refresh(notification)
+    await session.commit()
+    await session.refresh(notification)
     
     return notification
 
 @router.patch("/mark-all-read")
 async def mark_all_notifications_as_read(
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Mark all notifications as read for the current user
@@ -68,20 +69,20 @@ async def mark_all_notifications_as_read(
         Notification.user_id == current_user.id,
         Notification.is_read == False
     )
-    notifications = session.exec(statement).all()
+    notifications = (await session.exec(statement)).all()
     
     for notification in notifications:
         notification.is_read = True
         session.add(notification)
     
-    session.commit()
+    await session.commit()
     
     return {"message": f"Marked {len(notifications)} notifications as read"}
 
 @router.post("/", response_model=Notification)
 async def create_notification(
     notification_data: NotificationCreate,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Create a new notification (typically called by system/admin)
@@ -97,7 +98,7 @@ async def create_notification(
     )
     
     session.add(new_notification)
-    session.commit()
-    session.refresh(new_notification)
+    await session.commit()
+    await session.refresh(new_notification)
     
     return new_notification 
\ No newline at end of file
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import List
 
 from models import ClaimTemplate, ClaimTemplateCreate, ClaimTemplateResponse
-from database import get_session
+from database import get_async_session
 
 router = APIRouter(
     prefix="/templates",
@@ -24,25 +25,25 @@ def template_to_response(template: ClaimTemplate) -> ClaimTemplateResponse:
 
 @router.get("/", response_model=List[ClaimTemplateResponse])
 async def get_claim_templates(
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Get all available claim templates
     """
     statement = select(ClaimTemplate)
-    templates = session.exec(statement).all()
+    templates = (await session.exec(statement)).all()
     return [template_to_response(template) for template in templates]
 
 @router.get("/{template_id}", response_model=ClaimTemplateResponse)
 async def get_claim_template(
     template_id: str,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Get a specific claim template by ID
     """
     statement = select(ClaimTemplate).where(ClaimTemplate.id == template_id)
-    template = session.exec(statement).first()
+    template = (await session.exec(statement)).first()
     
     if not template:
         raise HTTPException(
@@ -55,7 +56,7 @@ async def get_claim_template(
 @router.post("/", response_model=ClaimTemplateResponse)
 async def create_claim_template(
     template_data: ClaimTemplateCreate,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Create a new claim template (admin endpoint)
@@ -69,7 +70,7 @@ async def create_claim_template(
     )
     
     session.add(new_template)
-    session.commit()
-    session.refresh(new_template)
+    await session.commit()
+    await session.refresh(new_template)
     
     return template_to_response(new_template) 
\ No newline at end of file
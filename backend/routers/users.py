@@ -1,10 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from datetime import datetime
 
 from models import User, UserUpdate
-from database import get_session
-from auth_utils import get_current_user
+from database import get_async_session
+from auth_utils import get_current_user, invalidate_cached_user
 
 router = APIRouter(
     prefix="/users",
@@ -25,20 +25,30 @@ async def get_current_user_info(
 async def update_current_user(
     user_update: UserUpdate,
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Update current user information
     """
+    # current_user may come from the identity cache, so load the row itself
+    db_user = await session.get(User, current_user.id)
+    
+    if not db_user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    
     # Update fields
     update_data = user_update.dict(exclude_unset=True)
     for field, value in update_data.items():
-        setattr(current_user, field, value)
+        setattr(db_user, field, value)
     
-    current_user.updated_at = datetime.utcnow()
+    db_user.updated_at = datetime.utcnow()
     
-    session.add(current_user)
-    session.commit()
-    session.refresh(current_user)
+    session.add(db_user)
+    await session.commit()
+    await session.refresh(db_user)
+    invalidate_cached_user(db_user.clerk_user_id)
     
-    return current_user 
\ No newline at end of file
+    return db_user 
\ No newline at end of file
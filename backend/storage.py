@@ -0,0 +1,729 @@
+import asyncio
+import hashlib
+import hmac
+import mmap
+import os
+import secrets
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Dict, Hashable, List, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+import httpx
+from fastapi import HTTPException, UploadFile, status
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+from dotenv import load_dotenv
+
+from cache_utils import SingleFlight, TTLCache
+
+# Load environment variables
+load_dotenv()
+
+# Storage configuration
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+STORAGE_BUCKET = os.getenv("STORAGE_BUCKET", "documents")
+# "supabase", "local", or unset for Supabase when configured and local files otherwise
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "")
+LOCAL_STORAGE_ROOT = os.getenv("LOCAL_STORAGE_ROOT", "./storage")
+# Key for local signed URLs; generated once into LOCAL_STORAGE_ROOT when unset
+LOCAL_STORAGE_SIGNING_KEY = os.getenv("LOCAL_STORAGE_SIGNING_KEY")
+# Local signed URLs point at this (unauthenticated) route
+LOCAL_SIGNED_URL_PREFIX = os.getenv("LOCAL_SIGNED_URL_PREFIX", "/api/documents/signed")
+
+# Download streaming chunk size
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(256 * 1024)))
+# Concurrent reads of the same object (or range) up to this length share one fetch
+SHARED_READ_MAX_BYTES = int(os.getenv("SHARED_READ_MAX_BYTES", str(1024 * 1024)))
+
+# Deletes are sent in batches of at most this many paths, this many batches at a time
+STORAGE_DELETE_BATCH_SIZE = int(os.getenv("STORAGE_DELETE_BATCH_SIZE", "1000"))
+STORAGE_DELETE_CONCURRENCY = int(os.getenv("STORAGE_DELETE_CONCURRENCY", "4"))
+
+# Page size when listing objects (reconciliation sweeps)
+STORAGE_LIST_PAGE_SIZE = int(os.getenv("STORAGE_LIST_PAGE_SIZE", "1000"))
+
+# Signed-URL mode: hand clients short-lived storage URLs instead of proxying bytes
+STORAGE_SIGNED_URLS = os.getenv("STORAGE_SIGNED_URLS", "false").lower() == "true"
+SIGNED_URL_TTL_SECONDS = int(os.getenv("SIGNED_URL_TTL_SECONDS", "600"))
+# Stop handing out a cached URL this long before it expires
+SIGNED_URL_REFRESH_MARGIN_SECONDS = int(os.getenv("SIGNED_URL_REFRESH_MARGIN_SECONDS", "60"))
+SIGNED_URL_CACHE_SIZE = int(os.getenv("SIGNED_URL_CACHE_SIZE", "10000"))
+
+# Upload limits (per worker)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(250 * 1024 * 1024)))
+MAX_INFLIGHT_UPLOAD_BYTES = int(os.getenv("MAX_INFLIGHT_UPLOAD_BYTES", str(1024 * 1024 * 1024)))
+# Allowance on top of a file's bytes for multipart boundaries, part headers and form fields
+MULTIPART_OVERHEAD_BYTES = int(os.getenv("MULTIPART_OVERHEAD_BYTES", str(64 * 1024)))
+
+class StorageError(Exception):
+    """Raised when the storage backend rejects or fails a request"""
+
+class ObjectNotFound(StorageError):
+    """Raised when the requested object does not exist"""
+
+class ObjectExists(StorageError):
+    """Raised when writing an object that is already stored"""
+
+class RangeNotSatisfiable(StorageError):
+    """Raised when a byte range lies outside the object"""
+    def __init__(self, size: Optional[int]):
+        super().__init__(f"Range not satisfiable for object of {size} bytes")
+        self.size = size
+
+# (first, last) byte positions as sent in a Range header: (start, None) is open-ended,
+# (None, n) means the last n bytes
+ByteRange = Tuple[Optional[int], Optional[int]]
+
+def resolve_range(byte_range: ByteRange, size: int) -> Tuple[int, int]:
+    """
+    Turn a Range header spec into inclusive (start, end) offsets within ``size`` bytes
+    """
+    first, last = byte_range
+    if first is None:
+        if not last:
+            raise RangeNotSatisfiable(size)
+        return max(0, size - last), size - 1
+    if first >= size:
+        raise RangeNotSatisfiable(size)
+    return first, size - 1 if last is None else min(last, size - 1)
+
+class StoredObject:
+    """
+    An open read of an object (or a byte range of it), streamed in chunks
+
+    ``chunks`` must be consumed or closed to release the underlying connection.
+    ``size`` (and with it ``end`` and ``content_length``) is None when storage
+    didn't say how long a full-body read is.
+    """
+    def __init__(
+        self,
+        chunks: AsyncIterator[bytes],
+        size: Optional[int],
+        start: int,
+        end: Optional[int],
+        partial: bool
+    ):
+        self.chunks = chunks
+        self.size = size
+        self.start = start
+        self.end = end
+        self.partial = partial
+
+    @property
+    def content_length(self) -> Optional[int]:
+        return None if self.end is None else self.end - self.start + 1
+
+def open_file(
+    full_path: str,
+    byte_range: Optional[ByteRange] = None,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE
+) -> StoredObject:
+    """
+    Stream a local file, or a byte range of it, as a StoredObject
+
+    The file is memory-mapped and chunks are memoryview slices of the mapping,
+    so bytes go from the page cache to the socket without being copied into
+    Python objects. Raises FileNotFoundError if the file does not exist.
+    """
+    with open(full_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        start, end = resolve_range(byte_range, size) if byte_range else (0, size - 1)
+        # The mapping keeps its own reference to the file and is unmapped once
+        # the last slice handed out is garbage collected
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    async def chunks() -> AsyncIterator[memoryview]:
+        if mapped is None:
+            return
+        view = memoryview(mapped)
+        for offset in range(start, end + 1, chunk_size):
+            upcoming = offset + chunk_size
+            if upcoming <= end and hasattr(mapped, "madvise"):
+                # Start reading the next chunk from disk while this one is sent
+                aligned = upcoming - upcoming % mmap.PAGESIZE
+                mapped.madvise(mmap.MADV_WILLNEED, aligned, min(end + 1, upcoming + chunk_size) - aligned)
+            yield view[offset:min(offset + chunk_size, end + 1)]
+
+    return StoredObject(chunks(), size, start, end, partial=byte_range is not None)
+
+_shared_reads = SingleFlight()
+
+async def open_read_shared(
+    storage: "StorageBackend",
+    path: str,
+    byte_range: Optional[ByteRange] = None
+) -> StoredObject:
+    """
+    ``storage.open_read``, with concurrent reads of the same object and range sharing one fetch
+
+    A read of known length up to SHARED_READ_MAX_BYTES is buffered once and
+    every caller waiting on it streams the buffer. Longer reads go to the
+    first caller as they are; callers that joined it open their own.
+    """
+    async def fetch() -> Tuple[StoredObject, Optional[bytes]]:
+        stored = await storage.open_read(path, byte_range)
+        if stored.content_length is None or stored.content_length > SHARED_READ_MAX_BYTES:
+            return stored, None
+        try:
+            return stored, b"".join([bytes(chunk) async for chunk in stored.chunks])
+        finally:
+            await stored.chunks.aclose()
+
+    (stored, data), shared = await _shared_reads.do((path, byte_range), fetch)
+    if data is None:
+        return await storage.open_read(path, byte_range) if shared else stored
+
+    async def chunks() -> AsyncIterator[memoryview]:
+        view = memoryview(data)
+        for offset in range(0, len(data), DOWNLOAD_CHUNK_SIZE):
+            yield view[offset:offset + DOWNLOAD_CHUNK_SIZE]
+
+    return StoredObject(chunks(), stored.size, stored.start, stored.end, stored.partial)
+
+class StorageBackend:
+    """
+    Interface implemented by every blob storage backend
+    """
+    # Whether create_signed_url is available
+    supports_signed_urls = False
+    # Objects already live on this node's disk (no point caching them locally)
+    is_local = False
+
+    async def open_read(
+        self,
+        path: str,
+        byte_range: Optional[ByteRange] = None,
+        chunk_size: int = DOWNLOAD_CHUNK_SIZE
+    ) -> StoredObject:
+        """
+        Start streaming an object, optionally just a byte range of it
+        """
+        raise NotImplementedError
+
+    async def put_stream(
+        self,
+        path: str,
+        chunks: AsyncIterator[bytes],
+        content_type: str,
+        size: Optional[int] = None
+    ) -> None:
+        """
+        Store an object from an async iterator of chunks, never holding it whole
+        """
+        raise NotImplementedError
+
+    async def create_signed_url(
+        self,
+        path: str,
+        expires_in: int,
+        download_name: Optional[str] = None,
+        content_type: Optional[str] = None
+    ) -> str:
+        """
+        Create a URL granting read access to an object for ``expires_in`` seconds
+
+        With ``download_name`` the URL serves the object as an attachment.
+        ``content_type`` is used by backends that don't store one per object.
+        """
+        raise NotImplementedError
+
+    async def delete_batch(self, paths: List[str]) -> None:
+        """
+        Remove up to STORAGE_DELETE_BATCH_SIZE objects; missing objects are not an error
+        """
+        raise NotImplementedError
+
+    async def delete_many(self, paths: List[str]) -> Dict[str, str]:
+        """
+        Remove any number of objects in bounded batches, a few batches at a time
+
+        Returns the paths whose batch failed, each with its batch's error, so
+        callers can log or retry them.
+        """
+        batches = [
+            paths[i:i + STORAGE_DELETE_BATCH_SIZE]
+            for i in range(0, len(paths), STORAGE_DELETE_BATCH_SIZE)
+        ]
+        limit = asyncio.Semaphore(STORAGE_DELETE_CONCURRENCY)
+
+        async def delete(batch: List[str]) -> None:
+            async with limit:
+                await self.delete_batch(batch)
+
+        outcomes = await asyncio.gather(*(delete(batch) for batch in batches), return_exceptions=True)
+        failed = {}
+        for batch, outcome in zip(batches, outcomes):
+            if isinstance(outcome, BaseException):
+                print(f"⚠️ Warning: Failed to delete {len(batch)} objects from storage: {str(outcome)}")
+                error = f"{type(outcome).__name__}: {outcome}"
+                failed.update(dict.fromkeys(batch, error))
+        return failed
+
+    def list_objects(self, prefix: str = "") -> AsyncIterator[Tuple[str, float]]:
+        """
+        Yield ``(path, modified_at)`` for every object under ``prefix``, recursively
+
+        ``modified_at`` is a Unix timestamp.
+        """
+        raise NotImplementedError
+
+class SupabaseStorage(StorageBackend):
+    """
+    Supabase Storage, spoken to over its REST API so bodies can be streamed
+
+    The supabase-py storage client only accepts whole ``bytes`` bodies.
+    """
+    supports_signed_urls = True
+
+    def __init__(self, url: str, service_key: str, bucket: str):
+        self.base_url = f"{url.rstrip('/')}/storage/v1"
+        self.service_key = service_key
+        self.bucket = bucket
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so the connection pool binds to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={
+                    "Authorization": f"Bearer {self.service_key}",
+                    "apikey": self.service_key,
+                },
+                timeout=httpx.Timeout(30.0, read=300.0, write=300.0),
+            )
+        return self._client
+
+    def object_url(self, path: str) -> str:
+        return f"/object/{self.bucket}/{quote(path)}"
+
+    async def put_stream(
+        self,
+        path: str,
+        chunks: AsyncIterator[bytes],
+        content_type: str,
+        size: Optional[int] = None
+    ) -> None:
+        headers = {"Content-Type": content_type, "x-upsert": "false"}
+        if size is not None:
+            headers["Content-Length"] = str(size)
+
+        response = await self.client.post(self.object_url(path), content=chunks, headers=headers)
+        # Storage reports duplicates as 409, or as 400 with a "Duplicate" error body
+        if response.status_code == 409 or (response.status_code == 400 and "Duplicate" in response.text):
+            raise ObjectExists(path)
+        if response.status_code >= 400:
+            raise StorageError(f"Upload of {path} failed ({response.status_code}): {response.text}")
+
+    async def open_read(
+        self,
+        path: str,
+        byte_range: Optional[ByteRange] = None,
+        chunk_size: int = DOWNLOAD_CHUNK_SIZE
+    ) -> StoredObject:
+        # Ask for the stored bytes as-is: a compressed transfer would be decoded
+        # by aiter_bytes and no longer match the Content-Length passed on
+        headers = {"Accept-Encoding": "identity"}
+        if byte_range:
+            first, last = byte_range
+            headers["Range"] = f"bytes={'' if first is None else first}-{'' if last is None else last}"
+
+        request = self.client.build_request(
+            "GET", f"/object/authenticated/{self.bucket}/{quote(path)}", headers=headers
+        )
+        response = await self.client.send(request, stream=True)
+
+        if response.status_code >= 400:
+            await response.aclose()
+            if response.status_code == 416:
+                content_range = response.headers.get("Content-Range", "")
+                total = content_range.rsplit("/", 1)[-1]
+                raise RangeNotSatisfiable(int(total) if total.isdigit() else None)
+            # Storage answers missing objects with 400 or 404 depending on version
+            if response.status_code in (400, 404):
+                raise ObjectNotFound(path)
+            raise StorageError(f"Download of {path} failed ({response.status_code})")
+
+        async def chunks() -> AsyncIterator[bytes]:
+            try:
+                async for chunk in response.aiter_bytes(chunk_size):
+                    yield chunk
+            finally:
+                await response.aclose()
+
+        if response.status_code == 206:
+            # Content-Range: bytes <start>-<end>/<size>
+            span, total = response.headers["Content-Range"].split(" ", 1)[1].split("/")
+            start, end = (int(offset) for offset in span.split("-"))
+            return StoredObject(chunks(), int(total), start, end, partial=True)
+
+        # Full body, either requested or because the range was ignored upstream.
+        # The length is unknown without a Content-Length, or if storage encoded
+        # the body anyway (aiter_bytes decodes it).
+        length = response.headers.get("Content-Length")
+        encoding = response.headers.get("Content-Encoding", "identity")
+        if length is None or not length.isdigit() or encoding != "identity":
+            if byte_range:
+                # Can't answer the range, nor say how long the object is
+                await response.aclose()
+                raise RangeNotSatisfiable(None)
+            return StoredObject(chunks(), None, 0, None, partial=False)
+        length = int(length)
+        return StoredObject(chunks(), length, 0, length - 1, partial=False)
+
+    async def create_signed_url(
+        self,
+        path: str,
+        expires_in: int,
+        download_name: Optional[str] = None,
+        content_type: Optional[str] = None
+    ) -> str:
+        response = await self.client.post(
+            f"/object/sign/{self.bucket}/{quote(path)}",
+            json={"expiresIn": expires_in}
+        )
+        if response.status_code in (400, 404):
+            raise ObjectNotFound(path)
+        if response.status_code >= 400:
+            raise StorageError(f"Signing {path} failed ({response.status_code}): {response.text}")
+
+        # signedURL is relative to the storage API root
+        signed_url = f"{self.base_url}{response.json()['signedURL']}"
+        if download_name is not None:
+            signed_url += f"&download={quote(download_name)}"
+        return signed_url
+
+    async def delete_batch(self, paths: List[str]) -> None:
+        response = await self.client.request(
+            "DELETE", f"/object/{self.bucket}", json={"prefixes": paths}
+        )
+        if response.status_code >= 400:
+            raise StorageError(f"Delete failed ({response.status_code}): {response.text}")
+
+    async def list_objects(self, prefix: str = "") -> AsyncIterator[Tuple[str, float]]:
+        # The list API is one folder level per call; folders come back without an id
+        folders = [prefix.strip("/")]
+        while folders:
+            folder = folders.pop()
+            offset = 0
+            while True:
+                response = await self.client.post(f"/object/list/{self.bucket}", json={
+                    "prefix": folder,
+                    "limit": STORAGE_LIST_PAGE_SIZE,
+                    "offset": offset,
+                    "sortBy": {"column": "name", "order": "asc"},
+                })
+                if response.status_code >= 400:
+                    raise StorageError(f"Listing {folder} failed ({response.status_code}): {response.text}")
+
+                items = response.json()
+                for item in items:
+                    path = f"{folder}/{item['name']}" if folder else item["name"]
+                    if item.get("id") is None:
+                        folders.append(path)
+                        continue
+                    modified = item.get("updated_at") or item.get("created_at")
+                    yield path, (
+                        datetime.fromisoformat(modified.replace("Z", "+00:00")).timestamp()
+                        if modified else time.time()
+                    )
+
+                if len(items) < STORAGE_LIST_PAGE_SIZE:
+                    break
+                offset += STORAGE_LIST_PAGE_SIZE
+
+def load_signing_key(root: str) -> bytes:
+    """
+    Signing key shared by every worker using ``root``, created on first use
+    """
+    os.makedirs(root, exist_ok=True)
+    key_path = os.path.join(root, ".signing-key")
+    try:
+        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(key_path) as f:
+            return f.read().strip().encode()
+    key = secrets.token_hex(32)
+    with os.fdopen(fd, "w") as f:
+        f.write(key)
+    return key.encode()
+
+class LocalStorage(StorageBackend):
+    """
+    Objects stored as plain files under a root directory, for on-prem and offline use
+
+    Reads are memory-mapped. Signed URLs are HMAC-signed links to
+    LOCAL_SIGNED_URL_PREFIX, served by the documents router.
+    """
+    supports_signed_urls = True
+    is_local = True
+
+    def __init__(self, root: str, bucket: str, signing_key: Optional[str] = None):
+        self.root = os.path.abspath(os.path.join(root, bucket))
+        # Kept outside the bucket directory so object listings never see it
+        self.signing_key = signing_key.encode() if signing_key else load_signing_key(os.path.abspath(root))
+
+    def sign(self, path: str, expires: int, download_name: Optional[str], content_type: Optional[str]) -> str:
+        message = "\n".join([path, str(expires), download_name or "", content_type or ""])
+        return hmac.new(self.signing_key, message.encode(), hashlib.sha256).hexdigest()
+
+    def verify(
+        self,
+        path: str,
+        expires: int,
+        signature: str,
+        download_name: Optional[str],
+        content_type: Optional[str]
+    ) -> bool:
+        """
+        Check a signed URL's parameters; False when tampered with or expired
+        """
+        expected = self.sign(path, expires, download_name, content_type)
+        return hmac.compare_digest(expected, signature) and expires > time.time()
+
+    async def create_signed_url(
+        self,
+        path: str,
+        expires_in: int,
+        download_name: Optional[str] = None,
+        content_type: Optional[str] = None
+    ) -> str:
+        if not os.path.exists(self.file_path(path)):
+            raise ObjectNotFound(path)
+
+        expires = int(time.time()) + expires_in
+        params = {"expires": expires, "signature": self.sign(path, expires, download_name, content_type)}
+        if download_name is not None:
+            params["download"] = download_name
+        if content_type is not None:
+            params["type"] = content_type
+        return f"{LOCAL_SIGNED_URL_PREFIX}/{quote(path)}?{urlencode(params)}"
+
+    def file_path(self, path: str) -> str:
+        full_path = os.path.abspath(os.path.join(self.root, path))
+        if not full_path.startswith(self.root + os.sep):
+            raise StorageError(f"Invalid object path: {path}")
+        return full_path
+
+    async def put_stream(
+        self,
+        path: str,
+        chunks: AsyncIterator[bytes],
+        content_type: str,
+        size: Optional[int] = None
+    ) -> None:
+        full_path = self.file_path(path)
+        if os.path.exists(full_path):
+            raise ObjectExists(path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+        # Write beside the target and rename, so readers never see partial objects
+        temp_path = f"{full_path}.{uuid.uuid4().hex}.part"
+        try:
+            with open(temp_path, "wb") as f:
+                async for chunk in chunks:
+                    await run_in_threadpool(f.write, chunk)
+            os.replace(temp_path, full_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    async def open_read(
+        self,
+        path: str,
+        byte_range: Optional[ByteRange] = None,
+        chunk_size: int = DOWNLOAD_CHUNK_SIZE
+    ) -> StoredObject:
+        try:
+            return open_file(self.file_path(path), byte_range, chunk_size)
+        except FileNotFoundError:
+            raise ObjectNotFound(path)
+
+    async def delete_batch(self, paths: List[str]) -> None:
+        def remove_all():
+            for path in paths:
+                try:
+                    os.remove(self.file_path(path))
+                except FileNotFoundError:
+                    pass
+
+        await run_in_threadpool(remove_all)
+
+    async def list_objects(self, prefix: str = "") -> AsyncIterator[Tuple[str, float]]:
+        def walk():
+            found = []
+            for dirpath, _, filenames in os.walk(os.path.join(self.root, prefix)):
+                for name in filenames:
+                    if name.endswith(".part"):
+                        continue
+                    full_path = os.path.join(dirpath, name)
+                    found.append((os.path.relpath(full_path, self.root), os.path.getmtime(full_path)))
+            return found
+
+        for entry in await run_in_threadpool(walk):
+            yield entry
+
+_storage: Optional[StorageBackend] = None
+
+def get_storage() -> StorageBackend:
+    """
+    Get the configured storage backend
+
+    Without STORAGE_BACKEND, Supabase is used when configured and files are
+    kept under LOCAL_STORAGE_ROOT otherwise.
+    """
+    global _storage
+    if _storage is None:
+        backend = STORAGE_BACKEND or ("supabase" if SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY else "local")
+        if backend == "supabase":
+            if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+                raise RuntimeError("STORAGE_BACKEND=supabase requires SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY")
+            _storage = SupabaseStorage(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, STORAGE_BUCKET)
+        elif backend == "local":
+            _storage = LocalStorage(LOCAL_STORAGE_ROOT, STORAGE_BUCKET, LOCAL_STORAGE_SIGNING_KEY)
+        else:
+            raise RuntimeError(f"Unknown STORAGE_BACKEND: {backend}")
+        print(f"🗄️ Using {backend} storage")
+    return _storage
+
+# (document id, updated_at, disposition) -> signed URL, dropped shortly before expiry
+signed_url_cache = TTLCache(max_size=SIGNED_URL_CACHE_SIZE)
+
+def signed_urls_enabled(storage: StorageBackend) -> bool:
+    return STORAGE_SIGNED_URLS and storage.supports_signed_urls
+
+async def get_signed_url(
+    storage: StorageBackend,
+    path: str,
+    cache_key: Hashable,
+    download_name: Optional[str] = None,
+    content_type: Optional[str] = None
+) -> Tuple[str, float]:
+    """
+    Get a signed URL for an object and its expiry time, re-signing only when the cached one runs low
+
+    ``cache_key`` must change whenever the object does (e.g. include ``updated_at``).
+    """
+    cached = signed_url_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    expires_at = time.time() + SIGNED_URL_TTL_SECONDS
+    signed_url = await storage.create_signed_url(path, SIGNED_URL_TTL_SECONDS, download_name, content_type)
+    signed_url_cache.set(
+        cache_key,
+        (signed_url, expires_at),
+        expires_at=expires_at - SIGNED_URL_REFRESH_MARGIN_SECONDS
+    )
+    return signed_url, expires_at
+
+class ByteBudget:
+    """
+    Asyncio semaphore counted in bytes, bounding concurrent in-flight upload bytes
+
+    A single request larger than the whole budget may still proceed, alone.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.available = capacity
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def reserve(self, size: int):
+        size = max(0, min(size, self.capacity))
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.available >= size)
+            self.available -= size
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.available += size
+                self._condition.notify_all()
+
+upload_budget = ByteBudget(MAX_INFLIGHT_UPLOAD_BYTES)
+
+class StreamDigest:
+    """
+    Running size and SHA-256 of a stream, enforcing the upload size limit
+    """
+    def __init__(self, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+
+    def update(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"File exceeds the {self.max_bytes} byte upload limit"
+            )
+        self._sha256.update(chunk)
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+def check_upload_size(size: Optional[int]) -> None:
+    """
+    Reject an upload up front when its declared size is over the limit
+    """
+    if size is not None and size > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File exceeds the {MAX_UPLOAD_BYTES} byte upload limit"
+        )
+
+class UploadSizeLimit:
+    """
+    ASGI middleware refusing oversized uploads by their declared Content-Length
+
+    Starlette spools a whole multipart body to disk before the endpoint, and
+    with it check_upload_size, gets to run; this answers 413 before any of it
+    is read. ``limits`` maps POST paths to the largest request body accepted.
+    Bodies sent without a Content-Length still meet StreamDigest's limit.
+    """
+    def __init__(self, app: ASGIApp, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["method"] == "POST":
+            limit = self.limits.get(scope["path"])
+            length = Headers(scope=scope).get("content-length", "")
+            if limit is not None and length.isdigit() and int(length) > limit:
+                response = JSONResponse(
+                    {"detail": f"Request exceeds the {limit} byte upload limit"},
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    # The unread body makes the connection unusable for another request
+                    headers={"Connection": "close"}
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+async def iter_upload_file(
+    file: UploadFile,
+    digest: Optional[StreamDigest] = None,
+    chunk_size: int = UPLOAD_CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    """
+    Yield a spooled upload in fixed-size chunks, feeding the digest (if any) as it goes
+    """
+    await file.seek(0)
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        if digest is not None:
+            digest.update(chunk)
+        yield chunk
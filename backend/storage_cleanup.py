@@ -0,0 +1,235 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, List, Set
+
+from sqlalchemy import delete, func, insert, text
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from dotenv import load_dotenv
+
+from database import async_engine, async_session_maker
+from models import Blob, DocumentNode, StorageOutbox
+from storage import get_storage
+from renditions import THUMBNAIL_SUFFIX
+from blob_store import lock_storage_paths
+
+# Load environment variables
+load_dotenv()
+
+# Outbox worker configuration
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "30"))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "10"))
+OUTBOX_RETRY_MAX_SECONDS = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", "3600"))
+
+# Orphan reconciliation (0 disables the sweep)
+STORAGE_RECONCILE_INTERVAL_SECONDS = float(os.getenv("STORAGE_RECONCILE_INTERVAL_SECONDS", str(6 * 3600)))
+# Objects younger than this may belong to an upload that hasn't committed yet
+STORAGE_RECONCILE_GRACE_SECONDS = float(os.getenv("STORAGE_RECONCILE_GRACE_SECONDS", "3600"))
+
+# Only one process sweeps at a time
+RECONCILE_LOCK_ID = 0x70617831
+
+async def enqueue_deletes(session: AsyncSession, paths: Iterable[str]) -> int:
+    """
+    Queue storage objects for removal in the caller's transaction
+
+    Nothing is removed until the transaction commits and the worker confirms
+    the object is no longer referenced.
+    """
+    rows = [{"path": path} for path in dict.fromkeys(paths)]
+    if rows:
+        await session.execute(insert(StorageOutbox), rows)
+    return len(rows)
+
+def referenced_base(path: str) -> str:
+    # A rendition lives as long as its original
+    return path[:-len(THUMBNAIL_SUFFIX)] if path.endswith(THUMBNAIL_SUFFIX) else path
+
+async def referenced_paths(session: AsyncSession, paths: List[str]) -> Set[str]:
+    """
+    The subset of ``paths`` still in use by a document or a blob row
+    """
+    bases = {path: referenced_base(path) for path in paths}
+    candidates = list(set(bases.values()))
+    in_use = set((await session.execute(
+        select(DocumentNode.file_url).where(DocumentNode.file_url.in_(candidates)).distinct()
+    )).scalars().all())
+    in_use.update((await session.execute(
+        select(Blob.storage_path).where(Blob.storage_path.in_(candidates))
+    )).scalars().all())
+    return {path for path, base in bases.items() if base in in_use}
+
+def retry_delay(attempts: int) -> float:
+    return min(OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1), OUTBOX_RETRY_MAX_SECONDS)
+
+class StorageCleanup:
+    """
+    Background worker draining the storage outbox, plus the orphan sweep
+
+    Each pass claims a batch of due rows with FOR UPDATE SKIP LOCKED, so any
+    number of workers can run side by side. Rows whose paths are referenced
+    again are dropped without touching storage; failed removals are retried
+    with exponential backoff.
+    """
+    def __init__(self):
+        self._wakeup = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self.removed = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def wake(self) -> None:
+        """
+        Drain now instead of at the next poll (call after committing outbox rows)
+        """
+        self._wakeup.set()
+
+    async def drain_batch(self) -> int:
+        """
+        Process one batch of due outbox rows; returns how many rows were claimed
+        """
+        storage = get_storage()
+        async with async_session_maker() as session:
+            statement = (
+                select(StorageOutbox)
+                .where(StorageOutbox.next_attempt_at <= datetime.utcnow())
+                .order_by(StorageOutbox.id)
+                .limit(OUTBOX_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            )
+            rows = (await session.exec(statement)).all()
+            if not rows:
+                return 0
+
+            # Hold off uploads of these objects until the removals commit
+            paths = [row.path for row in rows]
+            await lock_storage_paths(session, [referenced_base(path) for path in paths])
+            in_use = await referenced_paths(session, paths)
+            to_remove = [row.path for row in rows if row.path not in in_use]
+            failed = await storage.delete_many(to_remove) if to_remove else {}
+
+            done = [row.id for row in rows if row.path not in failed]
+            await session.execute(delete(StorageOutbox).where(StorageOutbox.id.in_(done)))
+            for row in rows:
+                if row.path in failed:
+                    row.attempts += 1
+                    row.next_attempt_at = datetime.utcnow() + timedelta(seconds=retry_delay(row.attempts))
+                    row.last_error = failed[row.path]
+                    session.add(row)
+            await session.commit()
+
+            self.removed += len(to_remove) - len(failed)
+            self.skipped += len(rows) - len(to_remove)
+            self.failed += len(failed)
+            return len(rows)
+
+    async def drain(self) -> None:
+        while not self._stopping.is_set() and await self.drain_batch() == OUTBOX_BATCH_SIZE:
+            pass
+
+    async def run_worker(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await self.drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Storage cleanup pass failed: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def reconcile(self) -> int:
+        """
+        Queue storage objects that no document or blob references (orphans)
+
+        Returns the number of objects queued; returns 0 without sweeping when
+        another process holds the sweep lock.
+        """
+        storage = get_storage()
+        cutoff = time.time() - STORAGE_RECONCILE_GRACE_SECONDS
+        queued = 0
+        # The lock lives on a dedicated connection for the whole sweep
+        async with async_engine.connect() as lock_connection:
+            locked = (await lock_connection.execute(
+                text("SELECT pg_try_advisory_lock(:lock_id)"), {"lock_id": RECONCILE_LOCK_ID}
+            )).scalar()
+            if not locked:
+                return 0
+            try:
+                async with async_session_maker() as session:
+                    batch: List[str] = []
+                    async for path, modified_at in storage.list_objects():
+                        if self._stopping.is_set():
+                            break
+                        if modified_at < cutoff:
+                            batch.append(path)
+                        if len(batch) >= OUTBOX_BATCH_SIZE:
+                            queued += await self._queue_orphans(session, batch)
+                            batch = []
+                    if batch:
+                        queued += await self._queue_orphans(session, batch)
+            finally:
+                await lock_connection.execute(
+                    text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": RECONCILE_LOCK_ID}
+                )
+
+        if queued:
+            print(f"🧹 Queued {queued} orphaned storage objects for removal")
+            self.wake()
+        return queued
+
+    async def _queue_orphans(self, session: AsyncSession, paths: List[str]) -> int:
+        in_use = await referenced_paths(session, paths)
+        already_queued = set((await session.execute(
+            select(StorageOutbox.path).where(StorageOutbox.path.in_(paths))
+        )).scalars().all())
+        count = await enqueue_deletes(
+            session, [path for path in paths if path not in in_use and path not in already_queued]
+        )
+        await session.commit()
+        return count
+
+    async def run_sweeper(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=STORAGE_RECONCILE_INTERVAL_SECONDS)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.reconcile()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Storage reconciliation failed: {str(e)}")
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._stopping.clear()
+        self._tasks.append(asyncio.create_task(self.run_worker()))
+        if STORAGE_RECONCILE_INTERVAL_SECONDS > 0:
+            self._tasks.append(asyncio.create_task(self.run_sweeper()))
+
+    async def stop(self) -> None:
+        """
+        Stop after the batch in hand; cancelling mid-commit can leave the connection hanging
+        """
+        self._stopping.set()
+        self.wake()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def stats(self) -> dict:
+        async with async_session_maker() as session:
+            pending = (await session.execute(select(func.count()).select_from(StorageOutbox))).scalar()
+        return {"pending": pending, "removed": self.removed, "skipped": self.skipped, "failed": self.failed}
+
+storage_cleanup = StorageCleanup()
@@ -0,0 +1,271 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator, List
+
+from fastapi import HTTPException, status
+from starlette.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Resumable upload configuration
+UPLOAD_STAGING_DIR = os.getenv(
+    "UPLOAD_STAGING_DIR",
+    os.path.join(tempfile.gettempdir(), "pax-upload-staging")
+)
+RESUMABLE_CHUNK_SIZE = int(os.getenv("RESUMABLE_CHUNK_SIZE", str(8 * 1024 * 1024)))
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv("UPLOAD_SESSION_TTL_SECONDS", str(24 * 3600)))
+# Declared bytes of live sessions allowed on this node's disk, per user and in total
+UPLOAD_STAGING_MAX_BYTES_PER_USER = int(os.getenv("UPLOAD_STAGING_MAX_BYTES_PER_USER", str(2 * 1024 ** 3)))
+UPLOAD_STAGING_MAX_BYTES = int(os.getenv("UPLOAD_STAGING_MAX_BYTES", str(20 * 1024 ** 3)))
+
+MANIFEST_NAME = "manifest.json"
+# The manifest is renamed to this while a request finalizes or aborts the session
+CLAIMED_NAME = "claimed.json"
+
+class UploadSessionStore:
+    """
+    Resumable uploads staged on local disk until they are finalized
+
+    Each session is a directory holding a JSON manifest and one file per
+    received chunk. Chunks are written to a temporary name and renamed into
+    place, so a retried or concurrent PUT of the same chunk is harmless.
+    Finalizing or aborting first claims the session (see ``claimed``).
+    Sessions are node-local: clients must finish an upload on the same node.
+    """
+    def __init__(self, root: str, chunk_size: int, ttl: int, max_bytes_per_user: int, max_bytes: int):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.ttl = ttl
+        self.max_bytes_per_user = max_bytes_per_user
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def _session_dir(self, upload_id: str) -> str:
+        # Upload ids are generated hex strings; refuse anything else
+        if not upload_id.isalnum():
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Upload session not found"
+            )
+        return os.path.join(self.root, upload_id)
+
+    def _chunk_path(self, upload_id: str, index: int) -> str:
+        return os.path.join(self._session_dir(upload_id), f"{index:06d}.chunk")
+
+    def create(self, **fields) -> dict:
+        """
+        Start a session for an upload of ``fields["size"]`` bytes
+
+        Refused while the user's live sessions (413), or everyone's (503),
+        already reserve too much of the staging disk.
+        """
+        live = self.purge_expired()
+        size = fields["size"]
+        user_staged = sum(manifest["size"] for manifest in live if manifest["user_id"] == fields["user_id"])
+        if user_staged + size > self.max_bytes_per_user:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Unfinished uploads may stage at most {self.max_bytes_per_user} bytes; finish or abort some first"
+            )
+        if sum(manifest["size"] for manifest in live) + size > self.max_bytes:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Upload staging is full, try again later"
+            )
+
+        upload_id = uuid.uuid4().hex
+        now = time.time()
+        manifest = {
+            **fields,
+            "id": upload_id,
+            "chunk_size": self.chunk_size,
+            "chunk_count": max(1, -(-size // self.chunk_size)),
+            "created_at": now,
+            "expires_at": now + self.ttl,
+        }
+
+        session_dir = self._session_dir(upload_id)
+        os.makedirs(session_dir)
+        with open(os.path.join(session_dir, MANIFEST_NAME), "w") as f:
+            json.dump(manifest, f)
+        return manifest
+
+    def load(self, upload_id: str, user_id: str) -> dict:
+        """
+        Load a live session owned by ``user_id``, or raise 404 (409 while it is claimed)
+        """
+        session_dir = self._session_dir(upload_id)
+        claimed = False
+        manifest = self._read_manifest(os.path.join(session_dir, MANIFEST_NAME))
+        if manifest is None:
+            manifest = self._read_manifest(os.path.join(session_dir, CLAIMED_NAME))
+            claimed = True
+
+        if not manifest or manifest["user_id"] != user_id or manifest["expires_at"] < time.time():
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Upload session not found"
+            )
+        if claimed:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Upload session is being finalized or aborted"
+            )
+        return manifest
+
+    def _read_manifest(self, path: str):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @contextmanager
+    def claimed(self, manifest: dict) -> Iterator[None]:
+        """
+        Hold a session for finalizing or aborting it; a concurrent claim gets 409
+
+        The manifest is atomically renamed to a marker, so only one request
+        wins, and loads (chunk uploads included) refuse the session meanwhile.
+        If the block raises, the session is handed back for a retry.
+        """
+        session_dir = self._session_dir(manifest["id"])
+        manifest_path = os.path.join(session_dir, MANIFEST_NAME)
+        claimed_path = os.path.join(session_dir, CLAIMED_NAME)
+        try:
+            os.rename(manifest_path, claimed_path)
+        except FileNotFoundError:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Upload session is being finalized or aborted"
+            )
+        try:
+            yield
+        except BaseException:
+            try:
+                os.rename(claimed_path, manifest_path)
+            except OSError:
+                pass
+            raise
+
+    def expected_chunk_size(self, manifest: dict, index: int) -> int:
+        if index < 0 or index >= manifest["chunk_count"]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Chunk index must be between 0 and {manifest['chunk_count'] - 1}"
+            )
+        if index < manifest["chunk_count"] - 1:
+            return manifest["chunk_size"]
+        return manifest["size"] - manifest["chunk_size"] * (manifest["chunk_count"] - 1)
+
+    async def write_chunk(self, manifest: dict, index: int, body: AsyncIterator[bytes]) -> None:
+        """
+        Stage one chunk from a request body, which must be exactly the chunk's size
+        """
+        expected = self.expected_chunk_size(manifest, index)
+        chunk_path = self._chunk_path(manifest["id"], index)
+        temp_path = f"{chunk_path}.{uuid.uuid4().hex}.part"
+
+        received = 0
+        try:
+            with open(temp_path, "wb") as f:
+                async for data in body:
+                    received += len(data)
+                    if received > expected:
+                        break
+                    await run_in_threadpool(f.write, data)
+
+            if received != expected:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Chunk {index} must be exactly {expected} bytes"
+                )
+            os.replace(temp_path, chunk_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def received_chunks(self, manifest: dict) -> List[int]:
+        session_dir = self._session_dir(manifest["id"])
+        return sorted(
+            int(name.split(".")[0])
+            for name in os.listdir(session_dir)
+            if name.endswith(".chunk")
+        )
+
+    def describe(self, manifest: dict) -> dict:
+        """
+        Client-facing status; ``offset`` is the length of the contiguous prefix received
+        """
+        received = self.received_chunks(manifest)
+        contiguous = 0
+        while contiguous < len(received) and received[contiguous] == contiguous:
+            contiguous += 1
+        offset = min(contiguous * manifest["chunk_size"], manifest["size"])
+
+        return {
+            "uploadId": manifest["id"],
+            "claimId": manifest["claim_id"],
+            "parentId": manifest["parent_id"],
+            "filename": manifest["filename"],
+            "size": manifest["size"],
+            "chunkSize": manifest["chunk_size"],
+            "chunkCount": manifest["chunk_count"],
+            "receivedChunks": received,
+            "offset": offset,
+            "complete": len(received) == manifest["chunk_count"],
+            "expiresAt": manifest["expires_at"],
+        }
+
+    async def iter_assembled(self, manifest: dict, read_size: int) -> AsyncIterator[bytes]:
+        """
+        Stream the staged chunks back in order without loading them whole
+        """
+        for index in range(manifest["chunk_count"]):
+            with open(self._chunk_path(manifest["id"], index), "rb") as f:
+                while True:
+                    data = await run_in_threadpool(f.read, read_size)
+                    if not data:
+                        break
+                    yield data
+
+    def discard(self, upload_id: str) -> None:
+        shutil.rmtree(self._session_dir(upload_id), ignore_errors=True)
+
+    def purge_expired(self) -> List[dict]:
+        """
+        Drop sessions past their expiry (called opportunistically); returns the live manifests
+        """
+        now = time.time()
+        live = []
+        for upload_id in os.listdir(self.root):
+            session_dir = os.path.join(self.root, upload_id)
+            manifest = (
+                self._read_manifest(os.path.join(session_dir, MANIFEST_NAME))
+                or self._read_manifest(os.path.join(session_dir, CLAIMED_NAME))
+            )
+            if manifest and "expires_at" in manifest:
+                expired = manifest["expires_at"] < now
+            else:
+                # Half-created or corrupt session: fall back to its age on disk
+                try:
+                    expired = os.path.getmtime(session_dir) + self.ttl < now
+                except OSError:
+                    expired = False
+            if expired:
+                shutil.rmtree(session_dir, ignore_errors=True)
+            elif manifest:
+                live.append(manifest)
+        return live
+
+upload_sessions = UploadSessionStore(
+    UPLOAD_STAGING_DIR, RESUMABLE_CHUNK_SIZE, UPLOAD_SESSION_TTL_SECONDS,
+    UPLOAD_STAGING_MAX_BYTES_PER_USER, UPLOAD_STAGING_MAX_BYTES
+)
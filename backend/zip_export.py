@@ -0,0 +1,193 @@
+import asyncio
+import io
+import os
+import zipfile
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from models import DocumentNode, DocumentType
+from storage import StorageBackend, ObjectNotFound
+
+# Load environment variables
+load_dotenv()
+
+# Files fetched ahead of the one being zipped, and chunks buffered per file
+EXPORT_PREFETCH_FILES = int(os.getenv("EXPORT_PREFETCH_FILES", "4"))
+EXPORT_PREFETCH_CHUNKS = int(os.getenv("EXPORT_PREFETCH_CHUNKS", "8"))
+
+# Earliest timestamp a ZIP entry can carry
+ZIP_EPOCH = datetime(1980, 1, 1)
+
+_END = object()
+
+class ZipStreamBuffer(io.RawIOBase):
+    """
+    Write-only, non-seekable sink for zipfile whose output is drained as it is produced
+
+    Being unseekable makes zipfile write data descriptors instead of seeking
+    back to patch local headers, so the archive can be streamed.
+    """
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._offset = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def archive_entries(nodes: List[DocumentNode], root_id: Optional[str]) -> List[Tuple[str, DocumentNode]]:
+    """
+    Archive names for a subtree, depth-first in explorer order (folders first, then by name)
+
+    ``root_id`` is the exported folder (its contents go at the archive root),
+    or None for a whole claim. Clashing names in a folder get " (n)" suffixes.
+    """
+    children: Dict[Optional[str], List[DocumentNode]] = {}
+    for node in nodes:
+        if node.id != root_id:
+            children.setdefault(node.parent_id, []).append(node)
+
+    def named_children(parent_id: Optional[str], prefix: str) -> Iterator[Tuple[str, DocumentNode]]:
+        siblings = sorted(
+            children.get(parent_id, []),
+            key=lambda node: (node.type != DocumentType.FOLDER, node.name.lower(), node.id)
+        )
+        used = set()
+        for node in siblings:
+            name = node.name.replace("/", "_").replace("\\", "_") or node.id
+            stem, dot, extension = name, "", ""
+            if node.type == DocumentType.FILE and "." in name:
+                stem, dot, extension = name.rpartition(".")
+            candidate, copy = name, 1
+            while candidate.lower() in used:
+                copy += 1
+                candidate = f"{stem} ({copy}){dot}{extension}"
+            used.add(candidate.lower())
+            suffix = "/" if node.type == DocumentType.FOLDER else ""
+            yield f"{prefix}{candidate}{suffix}", node
+
+    # Iterative depth-first walk: each folder is followed by its own contents
+    entries = []
+    stack = [named_children(root_id, "")]
+    while stack:
+        entry = next(stack[-1], None)
+        if entry is None:
+            stack.pop()
+            continue
+        arcname, node = entry
+        if node.type == DocumentType.FOLDER:
+            entries.append(entry)
+            stack.append(named_children(node.id, arcname))
+        elif node.file_url and not node.file_url.startswith("/demo/"):
+            entries.append(entry)
+    return entries
+
+def zip_info(arcname: str, node: DocumentNode) -> zipfile.ZipInfo:
+    modified = max(node.updated_at or ZIP_EPOCH, ZIP_EPOCH)
+    info = zipfile.ZipInfo(arcname, date_time=modified.timetuple()[:6])
+    info.compress_type = zipfile.ZIP_STORED
+    if arcname.endswith("/"):
+        info.external_attr = (0o40755 << 16) | 0x10
+    else:
+        info.external_attr = 0o644 << 16
+    return info
+
+async def _prefetch(storage: StorageBackend, node: DocumentNode, queue: asyncio.Queue) -> None:
+    """
+    Feed one object's chunks into a bounded queue, ending with _END (or an exception)
+
+    The storage stream is closed however this ends, including when cancelled.
+    """
+    stored = None
+    try:
+        stored = await storage.open_read(node.file_url)
+        async for chunk in stored.chunks:
+            await queue.put(chunk)
+        await queue.put(_END)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await queue.put(e)
+    finally:
+        if stored is not None:
+            await stored.chunks.aclose()
+
+async def stream_zip(storage: StorageBackend, entries: List[Tuple[str, DocumentNode]]) -> AsyncIterator[bytes]:
+    """
+    Yield a ZIP archive of ``entries`` as it is assembled, in constant memory
+
+    Up to EXPORT_PREFETCH_FILES upcoming files are fetched concurrently, each
+    into a queue of at most EXPORT_PREFETCH_CHUNKS chunks, while the current
+    file is written out. Files missing from storage are left out.
+    """
+    buffer = ZipStreamBuffer()
+    archive = zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True)
+
+    files = iter([node for arcname, node in entries if not arcname.endswith("/")])
+    window = deque()
+
+    def prefetch_next() -> None:
+        node = next(files, None)
+        if node is not None:
+            queue = asyncio.Queue(maxsize=EXPORT_PREFETCH_CHUNKS)
+            window.append((queue, asyncio.create_task(_prefetch(storage, node, queue))))
+
+    for _ in range(EXPORT_PREFETCH_FILES):
+        prefetch_next()
+
+    # Task of the file being written out, no longer in the window
+    current = None
+    try:
+        for arcname, node in entries:
+            if arcname.endswith("/"):
+                archive.writestr(zip_info(arcname, node), b"")
+                yield buffer.drain()
+                continue
+
+            queue, current = window.popleft()
+            prefetch_next()
+
+            item = await queue.get()
+            if isinstance(item, BaseException):
+                if not isinstance(item, ObjectNotFound):
+                    raise item
+                print(f"⚠️ Export skipped {arcname}: object missing from storage")
+                continue
+
+            with archive.open(zip_info(arcname, node), mode="w", force_zip64=True) as entry:
+                while item is not _END:
+                    if isinstance(item, BaseException):
+                        raise item
+                    entry.write(item)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+                    item = await queue.get()
+            yield buffer.drain()
+
+        archive.close()
+        yield buffer.drain()
+    finally:
+        # On a disconnect or error mid-file, stop every fetch still running and
+        # let them close their storage streams
+        tasks = [task for _, task in window]
+        if current is not None:
+            tasks.append(current)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)